@@ -0,0 +1,83 @@
+"""
+A minimal benchmark harness that times registered benchmarks, writes the
+results as JSON and compares them against a stored baseline.
+"""
+import fnmatch
+import json
+import platform
+import sys
+import time
+import timeit
+
+
+BENCHMARKS = []
+
+
+def benchmark(name, repeat=5, number=1):
+    """
+    Register a benchmark function. The function receives the fixture
+    returned by ``setup`` in suite.py.
+    """
+    def register(func):
+        BENCHMARKS.append((name, func, repeat, number))
+        return func
+    return register
+
+
+def run(fixture, pattern='*', repeat=None, stream=sys.stdout):
+    """
+    Run the benchmarks matching ``pattern`` and return a dict of results
+    mapping names to the best time in seconds per call.
+    """
+    results = {}
+    for name, func, default_repeat, number in BENCHMARKS:
+        if not fnmatch.fnmatch(name, pattern):
+            continue
+        timer = timeit.Timer(lambda: func(fixture), timer=time.time)
+        times = timer.repeat(repeat=repeat or default_repeat, number=number)
+        best = min(times) / number
+        results[name] = best
+        print >> stream, "%-30s %10.4fs" % (name, best)
+    return results
+
+
+def dump(results, filename):
+
+    import ROOT
+    output = {
+        'python': platform.python_version(),
+        'root': ROOT.gROOT.GetVersion(),
+        'machine': platform.node(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'results': results,
+    }
+    with open(filename, 'w') as f:
+        json.dump(output, f, indent=2, sort_keys=True)
+
+
+def compare(results, baseline_filename, threshold=0.2, stream=sys.stdout):
+    """
+    Compare results against a baseline and return the names of the
+    benchmarks that are slower than the baseline by more than the threshold
+    (a fraction). The baseline may override the threshold of individual
+    benchmarks with a "thresholds" mapping.
+    """
+    with open(baseline_filename) as f:
+        baseline = json.load(f)
+    thresholds = baseline.get('thresholds', {})
+    regressions = []
+    print >> stream, "\n%-30s %10s %10s %8s" % (
+        'benchmark', 'baseline', 'current', 'change')
+    for name in sorted(results):
+        if name not in baseline['results']:
+            print >> stream, "%-30s %10s %9.4fs" % (name, '-', results[name])
+            continue
+        reference = max(baseline['results'][name], 1e-9)
+        change = (results[name] - reference) / reference
+        flag = ''
+        if change > thresholds.get(name, threshold):
+            regressions.append(name)
+            flag = ' REGRESSION'
+        print >> stream, "%-30s %9.4fs %9.4fs %+7.1f%%%s" % (
+            name, reference, results[name], change * 100, flag)
+    return regressions
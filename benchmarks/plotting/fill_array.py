@@ -50,7 +50,7 @@ print
 print '=' * 40
 print
 
-print "Using compiled C extension..."
+print "Using fill_array..."
 cProfile.run('h.fill_array(array)')
 
 h.Reset()
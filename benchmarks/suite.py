@@ -0,0 +1,225 @@
+#!/usr/bin/env python
+"""
+Run the rootpy benchmark suite, write the results as JSON and optionally
+compare them against a baseline to detect performance regressions:
+
+    ./suite.py -o results.json
+    ./suite.py --baseline baseline.json --threshold 0.2
+
+The exit status is 1 if any benchmark is slower than the baseline by more
+than the threshold.
+"""
+from rootpy.extern.argparse import ArgumentParser
+
+parser = ArgumentParser(description=__doc__)
+parser.add_argument('-o', '--output', default=None,
+        help="write the results as JSON into this file")
+parser.add_argument('-b', '--baseline', default=None,
+        help="compare the results with this JSON file")
+parser.add_argument('-t', '--threshold', type=float, default=0.2,
+        help="maximum allowed slowdown relative to the baseline "
+             "as a fraction")
+parser.add_argument('-k', '--pattern', default='*',
+        help="only run the benchmarks matching this pattern")
+parser.add_argument('-r', '--repeat', type=int, default=None,
+        help="number of repetitions of each benchmark")
+parser.add_argument('-n', '--entries', type=int, default=100000,
+        help="number of entries in the benchmark trees")
+args = parser.parse_args()
+
+import os
+import shutil
+import sys
+import tempfile
+from random import gauss
+
+import ROOT
+ROOT.gROOT.SetBatch(True)
+
+from rootpy.io import root_open, merge_files
+from rootpy.tree import Tree, TreeChain, TreeModel, FloatCol, IntCol
+from rootpy.plotting import Hist, Hist2D
+
+from harness import benchmark, run, dump, compare
+
+NFILES = 4
+
+
+class Event(TreeModel):
+
+    x = FloatCol()
+    y = FloatCol()
+    z = FloatCol()
+    i = IntCol()
+
+
+def write_tree(filename, entries):
+
+    with root_open(filename, 'recreate'):
+        tree = Tree('tree', model=Event)
+        for i in xrange(entries):
+            tree.x = gauss(.5, 1.)
+            tree.y = gauss(.3, 2.)
+            tree.z = gauss(13., 42.)
+            tree.i = i
+            tree.fill()
+        tree.write()
+
+
+class Fixture(object):
+
+    def __init__(self, entries):
+
+        self.entries = entries
+        self.tmpdir = tempfile.mkdtemp()
+        self.tree_files = [self.path('tree%d.root' % i)
+                           for i in xrange(NFILES)]
+        for filename in self.tree_files:
+            write_tree(filename, entries // NFILES)
+        self.hist_file = self.path('hists.root')
+        with root_open(self.hist_file, 'recreate') as f:
+            for i in xrange(20):
+                d = f.mkdir('dir%d' % i)
+                for j in xrange(5):
+                    sub = d.mkdir('sub%d' % j)
+                    sub.cd()
+                    for k in xrange(10):
+                        Hist(100, 0, 1, name='hist%d' % k).Write()
+        self.values = [gauss(0, 1) for _ in xrange(entries)]
+
+    def path(self, name):
+
+        return os.path.join(self.tmpdir, name)
+
+    def cleanup(self):
+
+        shutil.rmtree(self.tmpdir)
+
+
+@benchmark('tree_write', repeat=3)
+def bench_tree_write(fixture):
+
+    write_tree(fixture.path('write.root'), fixture.entries // NFILES)
+
+
+@benchmark('tree_read')
+def bench_tree_read(fixture):
+
+    with root_open(fixture.tree_files[0]) as f:
+        for event in f.tree:
+            event.x
+
+
+@benchmark('tree_read_on_demand')
+def bench_tree_read_on_demand(fixture):
+
+    with root_open(fixture.tree_files[0]) as f:
+        tree = f.tree
+        tree.read_branches_on_demand(True)
+        for event in tree:
+            event.x
+
+
+@benchmark('chain_iterate', repeat=3)
+def bench_chain_iterate(fixture):
+
+    chain = TreeChain('tree', fixture.tree_files)
+    for event in chain:
+        event.x
+
+
+@benchmark('tree_draw')
+def bench_tree_draw(fixture):
+
+    with root_open(fixture.tree_files[0]) as f:
+        f.tree.Draw('x', 'y>0', hist=Hist(100, -3, 3))
+
+
+@benchmark('tree_draw_2d')
+def bench_tree_draw_2d(fixture):
+
+    with root_open(fixture.tree_files[0]) as f:
+        f.tree.Draw('x:y', 'z>0', hist=Hist2D(50, -3, 3, 50, -3, 3))
+
+
+@benchmark('chain_draw', repeat=3)
+def bench_chain_draw(fixture):
+
+    chain = TreeChain('tree', fixture.tree_files)
+    chain.Draw('x', 'y>0', hist=Hist(100, -3, 3))
+
+
+@benchmark('hist_fill')
+def bench_hist_fill(fixture):
+
+    hist = Hist(100, -3, 3)
+    for value in fixture.values:
+        hist.Fill(value)
+
+
+@benchmark('hist_fill_array')
+def bench_hist_fill_array(fixture):
+
+    Hist(100, -3, 3).fill_array(fixture.values)
+
+
+@benchmark('hist_arithmetic')
+def bench_hist_arithmetic(fixture):
+
+    a = Hist(1000, 0, 1)
+    b = Hist(1000, 0, 1)
+    for _ in xrange(100):
+        c = a + b
+        c -= a
+        c *= 2
+        c /= b
+
+
+@benchmark('hist_iterate')
+def bench_hist_iterate(fixture):
+
+    hist = Hist2D(100, 0, 1, 100, 0, 1)
+    for _ in xrange(10):
+        list(hist.z())
+
+
+@benchmark('file_walk')
+def bench_file_walk(fixture):
+
+    with root_open(fixture.hist_file) as f:
+        for path, dirs, objects in f.walk():
+            pass
+
+
+@benchmark('file_get')
+def bench_file_get(fixture):
+
+    with root_open(fixture.hist_file) as f:
+        for i in xrange(20):
+            for k in xrange(10):
+                f.Get('dir%d/sub0/hist%d' % (i, k))
+
+
+@benchmark('file_merge', repeat=3)
+def bench_file_merge(fixture):
+
+    merge_files(fixture.tree_files + [fixture.hist_file],
+                fixture.path('merged.root'))
+
+
+if __name__ == '__main__':
+
+    fixture = Fixture(args.entries)
+    try:
+        results = run(fixture, pattern=args.pattern, repeat=args.repeat)
+    finally:
+        fixture.cleanup()
+    if args.output is not None:
+        dump(results, args.output)
+    if args.baseline is not None:
+        regressions = compare(results, args.baseline,
+                              threshold=args.threshold)
+        if regressions:
+            print "\n%d regression(s): %s" % (
+                len(regressions), ', '.join(regressions))
+            sys.exit(1)
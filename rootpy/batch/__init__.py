@@ -7,3 +7,4 @@ ROOT.gROOT.SetBatch(True)
 
 from .student import Student
 from .supervisor import Supervisor
+from .shared import SharedHist
@@ -0,0 +1,381 @@
+# Copyright 2012 the rootpy developers
+# distributed under the terms of the GNU General Public License
+"""
+This module lets students on other hosts work for a Supervisor. The
+Supervisor serves its work units over TCP with a broker (a
+multiprocessing.managers server) and each worker host runs :func:`work` (or
+the ``rootpy-worker`` script), which starts local students that pull units
+from the broker and upload their output files to it when they finish.
+"""
+import os
+import time
+import threading
+import logging
+import multiprocessing
+from multiprocessing.managers import BaseManager
+# multiprocessing uses the exceptions from the Queue module
+import Queue
+
+from .scheduler import WorkQueue, REQUEST, DONE
+from .. import log; log = log[__name__]
+
+__all__ = [
+    'Broker',
+    'RemoteWorkQueue',
+    'work',
+]
+
+NCPUS = multiprocessing.cpu_count()
+
+# message sent to the supervisor when a remote student has joined
+HIRE = 'hire'
+
+# size of the chunks of output files uploaded to the broker
+CHUNK_SIZE = 16 * 1024 * 1024
+
+
+class BrokerManager(BaseManager):
+    pass
+
+BrokerManager.register('broker')
+
+
+def _connect(address, authkey):
+
+    manager = BrokerManager(address=address, authkey=authkey)
+    manager.connect()
+    return manager.broker()
+
+
+class RemoteStudent(object):
+    """
+    Stand-in for a student on another host in the Supervisor's process
+    table. The student is considered lost if it has not been heard of for
+    ``timeout`` seconds.
+    """
+    def __init__(self, uuid, timeout):
+
+        self.uuid = uuid
+        self.timeout = timeout
+        self.files = self
+        self.replies = Queue.Queue()
+        self.exitcode = None
+        self.dismissed = False
+        self.last_seen = time.time()
+
+    def start(self):
+
+        pass
+
+    def join(self, timeout=None):
+
+        pass
+
+    def is_alive(self):
+
+        return (self.exitcode is None and
+                time.time() - self.last_seen < self.timeout)
+
+    def terminate(self):
+
+        # the student stops when it requests its next unit
+        self.replies.put(None)
+
+
+class Broker(object):
+    """
+    Serve the work units of a Supervisor over TCP. The methods of this
+    class are called by remote students through a proxy. Events are
+    forwarded to the Supervisor through its output queue so that remote
+    students are supervised like local ones.
+
+    Parameters
+    ----------
+    supervisor : Supervisor
+        The supervisor
+
+    address : tuple
+        The (host, port) to listen on. Use port 0 to pick a free port.
+
+    authkey : str
+        The key that workers must present to connect
+
+    timeout : int, optional (default=60)
+        Remote students that have not been heard of for this number of
+        seconds are considered lost and their units are handed out again
+    """
+    def __init__(self, supervisor, address, authkey, timeout=60):
+
+        if not authkey:
+            raise ValueError("an authkey is required to serve work units")
+        self.supervisor = supervisor
+        self.timeout = timeout
+        self.students = {}
+        self.closed = False
+        self._lock = threading.Lock()
+
+        class Manager(BaseManager):
+            pass
+
+        Manager.register('broker', callable=lambda: self)
+        self._server = Manager(address=address, authkey=authkey).get_server()
+        self.address = self._server.address
+        thread = threading.Thread(target=self._server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        log.info("serving work units on %s:%d" % self.address)
+
+    def _student(self, uuid):
+
+        student = self.students.get(uuid)
+        if student is not None:
+            student.last_seen = time.time()
+        return student
+
+    def _output(self, uuid):
+
+        return os.path.join(os.path.abspath(self.supervisor.outputpath),
+            'student-%s-%s.root' % (self.supervisor.name, uuid))
+
+    def config(self):
+        """
+        Return the arguments of the students
+        """
+        supervisor = self.supervisor
+        return dict(
+            student=supervisor.process,
+            name=supervisor.name,
+            metadata=supervisor.metadata,
+            nice=supervisor.nice,
+            args=supervisor.args,
+            kwargs=supervisor.kwargs)
+
+    def hire(self, uuid):
+        """
+        Register a new student. Returns False if no work is left.
+        """
+        if self.closed or not len(self.supervisor.scheduler):
+            return False
+        with self._lock:
+            self.students[uuid] = RemoteStudent(uuid, self.timeout)
+        self.supervisor.output_queue.put((uuid, HIRE, None))
+        return True
+
+    def request(self, uuid):
+        """
+        Return the next unit of a student or None if no work is left
+        """
+        student = self._student(uuid)
+        if self.closed or student is None or student.dismissed:
+            return None
+        self.supervisor.output_queue.put((uuid, REQUEST, None))
+        return student.replies.get()
+
+    def heartbeat(self, uuids):
+
+        for uuid in uuids:
+            self._student(uuid)
+
+    def dismiss(self, uuid):
+        """
+        Tell a student that was replaced that no work is left
+        """
+        student = self.students.get(uuid)
+        if student is not None:
+            student.dismissed = True
+            student.replies.put(None)
+
+    def upload(self, uuid, data):
+        """
+        Append a chunk of the output file of a student
+        """
+        self._student(uuid)
+        with open(self._output(uuid), 'ab') as outfile:
+            outfile.write(data)
+
+    def done(self, uuid, filters):
+        """
+        A student has finished and uploaded its output file
+        """
+        if self._student(uuid) is None:
+            return
+        self.students[uuid].exitcode = 0
+        self.supervisor.output_queue.put(
+            (uuid, DONE, [filters, self._output(uuid)]))
+
+    def fail(self, uuid):
+        """
+        A student has failed
+        """
+        if self._student(uuid) is None:
+            return
+        self.students[uuid].exitcode = 1
+        output = self._output(uuid)
+        if os.path.exists(output):
+            os.unlink(output)
+        self.supervisor.output_queue.put((uuid, DONE, None))
+
+    def close(self):
+        """
+        Stop handing out work units. Waiting students are told that no work
+        is left.
+        """
+        self.closed = True
+        with self._lock:
+            for student in self.students.values():
+                student.replies.put(None)
+
+
+class RemoteWorkQueue(WorkQueue):
+    """
+    A WorkQueue that requests units from a broker over TCP
+    """
+    def __init__(self, address, authkey, uuid=None):
+
+        self.address = address
+        self.authkey = authkey
+        self.uuid = uuid
+        self._finished = False
+        self._broker = None
+        self._pid = None
+
+    @property
+    def broker(self):
+
+        # connections cannot be shared with forked processes
+        if self._pid != os.getpid():
+            self._broker = _connect(self.address, self.authkey)
+            self._pid = os.getpid()
+        return self._broker
+
+    def get(self, block=True, timeout=None):
+
+        if self._finished:
+            return None
+        unit = self.broker.request(self.uuid)
+        if unit is None:
+            self._finished = True
+        return unit
+
+    def close(self):
+
+        pass
+
+
+def _forward_logs(queue):
+
+    while True:
+        record = queue.get()
+        if record is None:
+            break
+        logging.getLogger(record.name).handle(record)
+
+
+def _heartbeat(address, authkey, running, stop, interval):
+
+    # use a connection of this thread
+    broker = _connect(address, authkey)
+    while not stop.wait(interval):
+        broker.heartbeat(list(running))
+
+
+def _upload(broker, uuid, filename):
+
+    with open(filename, 'rb') as infile:
+        while True:
+            data = infile.read(CHUNK_SIZE)
+            if not data:
+                break
+            broker.upload(uuid, data)
+    os.unlink(filename)
+
+
+def work(address, authkey, nstudents=NCPUS, heartbeat=10):
+    """
+    Run students on this host for a Supervisor serving work units on
+    ``address`` until no work is left. The Student class of the Supervisor
+    must be importable on this host.
+
+    Parameters
+    ----------
+    address : tuple
+        The (host, port) of the broker
+
+    authkey : str
+        The key of the broker
+
+    nstudents : int, optional (default=number of CPUs)
+        The number of students to run in parallel
+
+    heartbeat : int, optional (default=10)
+        The number of seconds between the messages telling the broker that
+        the students on this host are alive
+    """
+    broker = _connect(address, authkey)
+    config = broker.config()
+    output_queue = multiprocessing.Queue(-1)
+    logging_queue = multiprocessing.Queue(-1)
+    forwarder = threading.Thread(target=_forward_logs, args=(logging_queue,))
+    forwarder.daemon = True
+    forwarder.start()
+    running = {}
+
+    def hire():
+        student = config['student'](
+            name=config['name'],
+            files=RemoteWorkQueue(address, authkey),
+            output_queue=output_queue,
+            logging_queue=logging_queue,
+            metadata=config['metadata'],
+            nice=config['nice'],
+            args=config['args'],
+            **config['kwargs'])
+        if not broker.hire(student.uuid):
+            return False
+        running[student.uuid] = student
+        student.start()
+        return True
+
+    for _ in xrange(nstudents):
+        if not hire():
+            break
+    log.info("started %i student(s)" % len(running))
+    # send heartbeats from a separate thread so that they are not delayed
+    # by uploads or other blocking steps of the loop below
+    stop = threading.Event()
+    beater = threading.Thread(target=_heartbeat,
+                              args=(address, authkey, running, stop,
+                                    heartbeat))
+    beater.daemon = True
+    beater.start()
+    suspects = set()
+    while running:
+        try:
+            uuid, kind, output = output_queue.get(timeout=heartbeat)
+        except Queue.Empty:
+            # students that are still not done after they stopped were
+            # killed without notice (i.e. by the OOM killer)
+            for uuid in suspects & set(running):
+                running.pop(uuid).join()
+                log.error("a student has failed")
+                broker.fail(uuid)
+                hire()
+            suspects = set(uuid for uuid, student in running.items()
+                           if not student.is_alive())
+            continue
+        student = running.pop(uuid)
+        student.join()
+        if output is not None and student.exitcode == 0:
+            filters, filename = output[:2]
+            _upload(broker, uuid, filename)
+            broker.done(uuid, filters)
+        else:
+            log.error("a student has failed")
+            broker.fail(uuid)
+        # keep the number of students constant while work is left
+        hire()
+    stop.set()
+    beater.join()
+    logging_queue.put(None)
+    forwarder.join()
+    log.info("no work left")
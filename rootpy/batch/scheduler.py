@@ -0,0 +1,167 @@
+# Copyright 2012 the rootpy developers
+# distributed under the terms of the GNU General Public License
+"""
+This module implements the dynamic scheduling of work units (files or
+:class:`rootpy.tree.shard.Shard` entry ranges) between the Supervisor and its
+Students. Students request a new unit each time they finish one, so fast
+students take over the remaining work of slow ones, and the units of a
+failed student are handed out again to other students.
+"""
+from collections import deque, defaultdict
+
+from .. import log; log = log[__name__]
+
+__all__ = [
+    'Scheduler',
+    'WorkQueue',
+]
+
+# message types sent by students to the supervisor
+REQUEST = 'request'
+DONE = 'done'
+
+# returned by Scheduler.request when a student must wait until other
+# students have finished or failed
+WAIT = object()
+
+
+class WorkQueue(object):
+    """
+    The student side of the scheduler. Drop-in replacement for the
+    multiprocessing.Queue of files that a Student receives in queue mode:
+    each call to ``get`` requests the next unit from the Supervisor and
+    returns None when no work is left.
+    """
+    def __init__(self, requests, replies, uuid=None):
+
+        self.requests = requests
+        self.replies = replies
+        self.uuid = uuid
+        self._finished = False
+
+    def get(self, block=True, timeout=None):
+
+        if self._finished:
+            return None
+        self.requests.put((self.uuid, REQUEST, None))
+        unit = self.replies.get(block, timeout)
+        if unit is None:
+            self._finished = True
+        return unit
+
+    def empty(self):
+
+        # not reliable (units are only known when requested)
+        return self._finished
+
+    def qsize(self):
+
+        # not reliable (units are only known when requested)
+        return 0 if self._finished else 1
+
+    def close(self):
+
+        self.replies.close()
+
+
+class Scheduler(object):
+    """
+    Keep track of the work units that are pending, in progress and completed
+    by each student.
+
+    Parameters
+    ----------
+    units : list
+        The work units (file names or shards)
+
+    retries : int, optional (default=0)
+        The number of times a unit is handed out again after the student
+        processing it failed. Units that still fail are skipped and listed
+        in ``failed``.
+    """
+    def __init__(self, units, retries=0):
+
+        self.pending = deque(units)
+        self.retries = retries
+        self.assigned = {}
+        self.completed = defaultdict(list)
+        self.attempts = defaultdict(int)
+        self.waiting = []
+        self.failed = []
+
+    def __len__(self):
+
+        return len(self.pending) + len(self.assigned)
+
+    def request(self, uuid):
+        """
+        A student has finished its current unit (if any) and requests the
+        next one. Return the next unit, None if no work is left or ``WAIT``
+        if the student must wait since units in progress may still fail and
+        be handed out again.
+        """
+        unit = self.assigned.pop(uuid, None)
+        if unit is not None:
+            self.completed[uuid].append(unit)
+        if self.pending:
+            unit = self.pending.popleft()
+            self.assigned[uuid] = unit
+            return unit
+        if self.assigned:
+            self.waiting.append(uuid)
+            return WAIT
+        return None
+
+    def wake(self):
+        """
+        Return a list of (uuid, unit) replies for waiting students that can
+        be answered now
+        """
+        replies = []
+        while self.waiting and (self.pending or not self.assigned):
+            uuid = self.waiting.pop(0)
+            replies.append((uuid, self.request(uuid)))
+        return replies
+
+    def finish(self, uuid):
+        """
+        A student has delivered its output, so its units are done
+        """
+        unit = self.assigned.pop(uuid, None)
+        if unit is not None:
+            self.completed[uuid].append(unit)
+        return self.completed.pop(uuid, [])
+
+    def fail(self, uuid):
+        """
+        A student has failed. The unit it was processing is handed out again
+        unless it has failed too often, and the units it completed are
+        handed out again since its output is lost. If the student failed
+        between units, all of its units count as failed.
+
+        Returns False if the student had not received any unit, i.e. it
+        failed for a reason unrelated to the data.
+        """
+        if uuid in self.waiting:
+            self.waiting.remove(uuid)
+        units = self.completed.pop(uuid, [])
+        unit = self.assigned.pop(uuid, None)
+        if unit is not None:
+            units.append(unit)
+            blamed = [len(units) - 1]
+        else:
+            blamed = range(len(units))
+        redo = []
+        for i, item in enumerate(units):
+            if i in blamed:
+                self.attempts[item] += 1
+                if self.attempts[item] > self.retries:
+                    log.error("giving up on %s after %i failure(s)" %
+                        (item, self.attempts[item]))
+                    self.failed.append(item)
+                    continue
+                log.warning("%s will be processed again (attempt %i of %i)" %
+                    (item, self.attempts[item] + 1, self.retries + 1))
+            redo.append(item)
+        self.pending.extendleft(reversed(redo))
+        return len(units) > 0
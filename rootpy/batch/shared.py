@@ -0,0 +1,126 @@
+# Copyright 2012 the rootpy developers
+# distributed under the terms of the GNU General Public License
+"""
+This module implements histograms that are filled by all students of a
+Supervisor on the same host and accumulated in shared memory instead of
+being written into each student's output file and merged.
+"""
+import os
+import multiprocessing
+
+from .. import log; log = log[__name__]
+
+__all__ = [
+    'SharedHist',
+]
+
+NCPUS = multiprocessing.cpu_count()
+
+# the number of statistics of TH1/TH2/TH3::GetStats
+NSTATS = 13
+
+
+class SharedHist(object):
+    """
+    A histogram filled in parallel by the students of a Supervisor
+
+    Create a SharedHist from an empty histogram before the Supervisor starts
+    and pass it to the students through the keyword arguments of the
+    Supervisor. In each student, a SharedHist behaves like a private copy of
+    the histogram (any Hist, Hist2D or Hist3D method may be called on it).
+    When a student finishes, its copy is added into one of ``slabs`` slabs
+    of shared memory (selected by process id and locked while adding) and
+    the Supervisor sums the slabs into the final histogram, which is written
+    into the output file.
+
+    Shared memory is inherited by forked processes only, so a SharedHist
+    cannot be used by students on other hosts.
+
+    Parameters
+    ----------
+    hist : Hist, Hist2D or Hist3D
+        The empty histogram defining the binning, name and title
+
+    slabs : int, optional (default=number of CPUs)
+        The number of slabs of shared memory
+    """
+    def __init__(self, hist, slabs=NCPUS):
+
+        if slabs < 1:
+            raise ValueError("slabs must be at least 1")
+        self.template = hist.Clone(hist.GetName())
+        self.template.Reset()
+        self.template.SetDirectory(0)
+        self._ncells = hist.GetSize()
+        # each slab holds the contents, the sum of squares of weights, the
+        # statistics and the number of entries
+        self._width = 2 * self._ncells + NSTATS + 1
+        self._slabs = multiprocessing.RawArray('d', slabs * self._width)
+        self._locks = [multiprocessing.Lock() for _ in xrange(slabs)]
+        self._hist = None
+        self._pid = None
+
+    @property
+    def hist(self):
+        """
+        The copy of the histogram filled in this process
+        """
+        if self._pid != os.getpid():
+            self._hist = self.template.Clone(self.template.GetName())
+            self._hist.SetDirectory(0)
+            self._pid = os.getpid()
+        return self._hist
+
+    def __getattr__(self, attr):
+
+        if attr.startswith('_'):
+            raise AttributeError(attr)
+        return getattr(self.hist, attr)
+
+    def _arrays(self):
+
+        import numpy as np
+        slabs = np.frombuffer(self._slabs, dtype=np.float64).reshape(
+            len(self._locks), self._width)
+        n = self._ncells
+        return (slabs[:, :n], slabs[:, n:2 * n],
+                slabs[:, 2 * n:2 * n + NSTATS], slabs[:, -1])
+
+    def commit(self):
+        """
+        Add the copy of the histogram filled in this process into the shared
+        memory and reset it
+        """
+        if self._hist is None or self._pid != os.getpid():
+            return
+        import numpy as np
+        hist = self._hist
+        stats = np.zeros(NSTATS, dtype=np.float64)
+        hist.GetStats(stats)
+        slab = os.getpid() % len(self._locks)
+        contents, sumw2, allstats, entries = self._arrays()
+        with self._locks[slab]:
+            contents[slab] += hist.contents_view().ravel('F')
+            sumw2[slab] += hist.errors_view().ravel('F')
+            allstats[slab] += stats
+            entries[slab] += hist.GetEntries()
+        hist.Reset()
+
+    def result(self):
+        """
+        Return a new histogram with the sum of all slabs
+        """
+        hist = self.template.Clone(self.template.GetName())
+        hist.SetDirectory(0)
+        contents, sumw2, stats, entries = self._arrays()
+        for lock in self._locks:
+            lock.acquire()
+        try:
+            hist.contents_view().ravel('F')[:] = contents.sum(axis=0)
+            hist.errors_view().ravel('F')[:] = sumw2.sum(axis=0)
+            hist.PutStats(stats.sum(axis=0))
+            hist.SetEntries(entries.sum())
+        finally:
+            for lock in self._locks:
+                lock.release()
+        return hist
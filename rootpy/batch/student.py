@@ -17,9 +17,10 @@ except AttributeError:
 
 import traceback
 import signal
-from rootpy.io import root_open
+from rootpy.io import root_open, merge_files
+from .scheduler import WorkQueue, DONE
+from .shared import SharedHist
 import cProfile as profile
-import subprocess
 
 
 class Student(Process):
@@ -48,7 +49,10 @@ class Student(Process):
         self.nice = nice
         self.kwargs = kwargs
         self.output = None
-        self.queuemode = isinstance(files, multiprocessing.queues.Queue)
+        self.queuemode = isinstance(files,
+            (multiprocessing.queues.Queue, WorkQueue))
+        if isinstance(files, WorkQueue):
+            files.uuid = self.uuid
         self.profile = profile
 
     def run(self):
@@ -92,24 +96,35 @@ class Student(Process):
                             globals=globals(),
                             locals=locals(),
                             filename=profile_filename)
+                    self.commit_shared()
                     self.output_queue.put(
-                            (self.uuid,
+                            (self.uuid, DONE,
                                 [self.filters,
                                  self.output.GetName(),
                                  profile_filename]))
                 else:
                     self.work()
+                    self.commit_shared()
                     self.output_queue.put(
-                            (self.uuid,
+                            (self.uuid, DONE,
                                 [self.filters, self.output.GetName()]))
         except:
             print sys.exc_info()
             traceback.print_tb(sys.exc_info()[2])
-            self.output_queue.put((self.uuid, None))
+            self.output_queue.put((self.uuid, DONE, None))
 
         self.output_queue.close()
         self.logging_queue.close()
 
+    def commit_shared(self):
+        """
+        Add the histograms filled in shared histograms (passed as keyword
+        arguments) into shared memory
+        """
+        for value in self.kwargs.values():
+            if isinstance(value, SharedHist):
+                value.commit()
+
     @staticmethod
     def merge(inputs, output, metadata):
         """
@@ -117,7 +132,8 @@ class Student(Process):
         Override this method to define merging behaviour suitable
         to your needs.
         """
-        subprocess.call(['hadd', output + '.root'] + inputs)
+        merge_files(inputs, output + '.root',
+                    processes=multiprocessing.cpu_count())
 
     def work(self):
         """
@@ -1,15 +1,17 @@
 # Copyright 2012 the rootpy developers
 # distributed under the terms of the GNU General Public License
 import ROOT
-import time
 import os
 import sys
+import time
 import multiprocessing
 from multiprocessing import Process
 # multiprocessing uses the exceptions from the Queue module
 import Queue
 from ..tree.filtering import FilterList
-from ..io import root_open
+from ..tree.shard import Shard, shard_files
+from ..data.catalog import get_catalog, partition
+from ..io import root_open, IncrementalMerger
 from ..plotting import Hist
 
 from ..logger import multilogging
@@ -23,6 +25,9 @@ except AttributeError:
 import traceback
 import signal
 from .student import Student
+from .scheduler import Scheduler, WorkQueue, REQUEST, WAIT
+from .broker import Broker, HIRE
+from .shared import SharedHist
 import pstats
 import cStringIO as StringIO
 import shutil
@@ -31,40 +36,6 @@ import shutil
 NCPUS = multiprocessing.cpu_count()
 
 
-class QueueFeeder(Process):
-
-    def __init__(self, connection, objects, queue, numclients, sentinel=None):
-
-        Process.__init__(self)
-        self.connection = connection
-        self.objects = objects
-        self.queue = queue
-        self.numclients = numclients
-        self.sentinel = sentinel
-
-    def run(self):
-
-        # ignore sigterm signal and let parent take care of this
-        signal.signal(signal.SIGINT, signal.SIG_IGN)
-
-        self.queue.cancel_join_thread()
-        self.objects = ([self.sentinel] * self.numclients) + \
-                       self.objects
-        while self.objects:
-            if self.connection.poll():
-                print "queue feeder is shutting down..."
-                break
-            try:
-                self.queue.put(self.objects[-1], 1)
-                self.objects.pop()
-            except Queue.Full:
-                pass
-        self.connection.close()
-        print "queue feeder is closing the queue..."
-        self.queue.close()
-        print "queue feeder will now terminate"
-
-
 class Supervisor(Process):
 
     def __init__(self,
@@ -81,6 +52,11 @@ class Supervisor(Process):
                  name=None,
                  profile=False,
                  args=None,
+                 treename=None,
+                 entries_per_shard=None,
+                 retries=0,
+                 broker=None,
+                 authkey=None,
                  **kwargs):
 
         Process.__init__(self)
@@ -99,7 +75,15 @@ class Supervisor(Process):
             self.name = self.process.__name__
         else:
             self.name = name
+        if entries_per_shard is not None:
+            # split the trees in the files into ranges of entries so large
+            # files are processed by many students in parallel
+            if treename is None:
+                raise ValueError(
+                    "treename is required when entries_per_shard is set")
+            files = shard_files(files, treename, entries_per_shard)
         self.files = files[:]
+        self.treename = treename
         self.metadata = metadata
         self.outputname = '.'.join([self.name, outputname])
         self.outputpath = outputpath
@@ -112,7 +96,20 @@ class Supervisor(Process):
             if nstudents < 1:
                 raise ValueError('``nstudents`` must be at least 1')
             self.nstudents = min(nstudents, len(self.files))
+        # serve the work units to students on other hosts on this
+        # (host, port) address instead of running students locally
+        self.broker_address = broker
+        self.authkey = authkey
+        if broker is not None:
+            for value in kwargs.values():
+                if isinstance(value, SharedHist):
+                    raise TypeError(
+                        "shared histograms cannot be filled on other hosts")
+            queuemode = True
+        self.broker = None
         self.queuemode = queuemode
+        # number of times the work of a failed student is handed out again
+        self.retries = retries
         self.student_outputs = []
         self.kwargs = kwargs
         self.args = args
@@ -147,30 +144,40 @@ class Supervisor(Process):
             sys.stderr = multilogging.stderr(log)
 
         if self.queuemode:
-            self.file_queue = multiprocessing.Queue(self.nstudents * 2)
-            self.file_queue_feeder_conn, connection = multiprocessing.Pipe()
-            self.file_queue_feeder = QueueFeeder(
-                    connection=connection,
-                    objects=self.files,
-                    queue=self.file_queue,
-                    numclients=self.nstudents,
-                    sentinel=None)
+            self.scheduler = Scheduler(self.files, retries=self.retries)
+
+        self.merger = None
+        if self.process.merge is Student.merge:
+            # merge the outputs in the background as students finish
+            self.merger = IncrementalMerger(
+                tmpdir=self.outputpath, delete_inputs=True)
 
         self.output_queue = multiprocessing.Queue(-1)
         try:
             log.info("Will run on %i file(s):" % len(self.files))
             for filename in self.files:
-                log.info("%s" % filename)
+                log.info(str(filename))
             sys.stdout.flush()
-            self.hire_students()
+            if self.broker_address is not None:
+                self.broker = Broker(self, self.broker_address, self.authkey)
+                self.process_table = {}
+            else:
+                self.hire_students()
             self.supervise()
+            if self.queuemode and self.scheduler.failed:
+                log.error("%i unit(s) were skipped after failing %i time(s):" %
+                    (len(self.scheduler.failed), self.retries + 1))
+                for unit in self.scheduler.failed:
+                    log.error(str(unit))
             self.publish()
         except:
             print sys.exc_info()
             traceback.print_tb(sys.exc_info()[2])
 
-        if self.queuemode:
-            self.file_queue.close()
+        if self.broker is not None:
+            self.broker.close()
+        if self.merger is not None:
+            self.merger.close()
         self.output_queue.close()
         self.logging_queue.put(None)
         self.listener.join()
@@ -178,82 +185,167 @@ class Supervisor(Process):
 
     def hire_students(self):
 
+        self.process_table = {}
         if self.queuemode:
-            students = [
-                self.process(
-                    name=self.name,
-                    files=self.file_queue,
-                    output_queue=self.output_queue,
-                    logging_queue=self.logging_queue,
-                    gridmode=self.gridmode,
-                    metadata=self.metadata,
-                    profile=self.profile,
-                    nice=self.nice,
-                    args=self.args,
-                    **self.kwargs
-                ) for _ in xrange(self.nstudents)]
+            for _ in xrange(self.nstudents):
+                self.hire_student()
         else:
-            # deal out files
-            filesets = [[] for _ in xrange(self.nstudents)]
-            while len(self.files) > 0:
-                for fileset in filesets:
-                    if len(self.files) > 0:
-                        fileset.append(self.files.pop(0))
+            # a fileset is handed out again if its student fails
+            self.filesets = {}
+            for fileset in self.deal_files():
+                student = self.hire_student(fileset)
+                self.filesets[student.uuid] = (fileset, 0)
+
+    def hire_student(self, files=None):
+        """
+        Create a student that receives its work units from the scheduler or
+        the files in ``files`` if not None
+        """
+        if files is None:
+            files = WorkQueue(self.output_queue, multiprocessing.Queue())
+        student = self.process(
+            name=self.name,
+            files=files,
+            output_queue=self.output_queue,
+            logging_queue=self.logging_queue,
+            gridmode=self.gridmode,
+            metadata=self.metadata,
+            profile=self.profile,
+            nice=self.nice,
+            args=self.args,
+            **self.kwargs)
+        self.process_table[student.uuid] = student
+        return student
+
+    def deal_files(self):
+        """
+        Deal out the files to the students. If the name of the tree is
+        known the files (or shards) are balanced by their number of entries,
+        otherwise they are dealt out one by one.
+        """
+        if self.treename is not None:
+            weights = []
+            try:
+                for filename in self.files:
+                    if isinstance(filename, Shard):
+                        weights.append(filename.entries)
                     else:
-                        break
-            students = [
-                self.process(
-                    name=self.name,
-                    files=fileset,
-                    output_queue=self.output_queue,
-                    logging_queue=self.logging_queue,
-                    gridmode=self.gridmode,
-                    metadata=self.metadata,
-                    profile=self.profile,
-                    nice=self.nice,
-                    args=self.args,
-                    **self.kwargs
-                ) for fileset in filesets]
-        self.process_table = dict([(p.uuid, p) for p in students])
+                        weights.append(get_catalog().entries(
+                            filename, self.treename))
+            except (IOError, OSError) as e:
+                log.warning("could not read the number of entries (%s), "
+                            "files will not be balanced" % e)
+            else:
+                get_catalog().save()
+                filesets = partition(self.files, weights, self.nstudents)
+                del self.files[:]
+                return filesets
+        filesets = [[] for _ in xrange(self.nstudents)]
+        while len(self.files) > 0:
+            for fileset in filesets:
+                if len(self.files) > 0:
+                    fileset.append(self.files.pop(0))
+                else:
+                    break
+        return filesets
 
     def supervise(self):
 
-        if self.queuemode:
-            self.file_queue_feeder.start()
         for student in self.process_table.values():
             student.start()
-        while self.process_table:
+        suspects = set()
+        checked = time.time()
+        while self.process_table or (
+                self.broker is not None and len(self.scheduler)):
             if self.connection is not None:
                 if self.connection.poll():
                     msg = self.connection.recv()
                     if msg is None:
                         self.retire()
                         return
-            while not self.output_queue.empty():
-                id, output = self.output_queue.get()
-                process = self.process_table[id]
-                process.join()
+            now = time.time()
+            if now - checked >= 1:
+                # students that are still not done one second after they
+                # stopped were killed without notice (i.e. by the OOM killer)
+                checked = now
+                for id in suspects & set(self.process_table):
+                    if not self.replace(id):
+                        self.retire()
+                        return
+                suspects = set(id for id, student in self.process_table.items()
+                               if not student.is_alive())
+            try:
+                id, kind, output = self.output_queue.get(timeout=1)
+            except Queue.Empty:
+                continue
+            if kind == HIRE:
+                # a student on another host has joined
+                self.process_table[id] = self.broker.students[id]
+                continue
+            if id not in self.process_table:
+                # late message from a student that was replaced
+                if kind == REQUEST and self.broker is not None:
+                    # tell it that no work is left so that it stops
+                    self.broker.dismiss(id)
+                continue
+            if kind == REQUEST:
+                self.reply([(id, self.scheduler.request(id))])
+                continue
+            process = self.process_table[id]
+            process.join()
+            if output is not None and process.exitcode == 0:
                 del self.process_table[id]
-                if output is not None and process.exitcode == 0:
-                    self.student_outputs.append(output)
-                else:
-                    log.error("a student has failed")
-                    self.retire()
-                    return
-
-            time.sleep(1)
+                self.student_outputs.append(output)
+                if self.merger is not None:
+                    self.merger.add(output[1])
+                if self.queuemode:
+                    self.scheduler.finish(id)
+                    self.reply(self.scheduler.wake())
+            elif not self.replace(id):
+                self.retire()
+                return
+
+    def reply(self, replies):
+        """
+        Send units from the scheduler to the students waiting for them
+        """
+        for id, unit in replies:
+            if unit is not WAIT:
+                self.process_table[id].files.replies.put(unit)
+
+    def replace(self, id):
+        """
+        Hand out the work of a failed student to a new student. Returns
+        False if the job cannot continue.
+        """
+        process = self.process_table.pop(id)
+        if self.broker is not None:
+            # a remote student that was only lost (i.e. its heartbeats were
+            # delayed) must stop instead of waiting for a unit forever
+            self.broker.dismiss(id)
+        process.join()
+        log.error("a student has failed (exit code %s)" % process.exitcode)
+        if self.queuemode:
+            if not self.scheduler.fail(id):
+                return False
+            self.reply(self.scheduler.wake())
+            if self.scheduler.pending and self.broker is None:
+                # remote hosts replace their failed students themselves
+                self.hire_student().start()
+            return True
+        fileset, attempts = self.filesets.pop(id)
+        if attempts >= self.retries:
+            return False
+        log.warning("files of the failed student will be processed again "
+                    "(attempt %i of %i)" % (attempts + 2, self.retries + 1))
+        student = self.hire_student(fileset)
+        self.filesets[student.uuid] = (fileset, attempts + 1)
+        student.start()
+        return True
 
     def retire(self):
 
         log.info("will now terminate...")
-        if self.queuemode:
-            # tell queue feeder to quit
-            log.info("shutting down file queue...")
-            self.file_queue_feeder_conn.send(None)
-            log.info("joining queue feeder...")
-            self.file_queue_feeder.join()
-            log.info("queue feeder is terminated")
-            self.file_queue_feeder_conn.close()
         log.info("terminating students...")
         for student in self.process_table.values():
             student.terminate()
@@ -301,7 +393,9 @@ class Supervisor(Process):
                 self.outputpath, '%s.root' % self.outputname)
             if os.path.exists(outputname):
                 os.unlink(outputname)
-            if len(outputs) == 1:
+            if self.merger is not None:
+                self.merger.finish(outputname)
+            elif len(outputs) == 1:
                 shutil.move(outputs[0], outputname)
             else:
                 self.process.merge(
@@ -341,3 +435,10 @@ class Supervisor(Process):
                                 cutflow[i + 1] = filter.count_funcs_passing[func_name]
                                 cutflow.GetXaxis().SetBinLabel(i + 2, filter.name)
                             cutflow.Write()
+            shared_hists = [value for value in self.kwargs.values()
+                            if isinstance(value, SharedHist)]
+            if shared_hists:
+                # write the sum of the histograms filled in shared memory
+                with root_open(outputname, 'UPDATE'):
+                    for shared_hist in shared_hists:
+                        shared_hist.result().Write()
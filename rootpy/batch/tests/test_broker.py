@@ -0,0 +1,87 @@
+# Copyright 2012 the rootpy developers
+# distributed under the terms of the GNU General Public License
+"""
+Tests for serving work units to students over TCP.
+"""
+from rootpy.batch.broker import Broker, RemoteWorkQueue, HIRE
+from rootpy.batch.scheduler import Scheduler, REQUEST, DONE
+
+from nose.tools import assert_equal, assert_true
+
+import shutil
+import tempfile
+import multiprocessing
+
+
+class FakeSupervisor(object):
+
+    name = 'test'
+    process = None
+    metadata = None
+    nice = 0
+    args = None
+    kwargs = {}
+
+    def __init__(self, units):
+
+        self.scheduler = Scheduler(units)
+        self.output_queue = multiprocessing.Queue()
+        self.outputpath = tempfile.mkdtemp()
+
+
+def _student(address, authkey, uuid):
+
+    queue = RemoteWorkQueue(address, authkey, uuid)
+    assert queue.broker.hire(uuid)
+    units = []
+    while True:
+        unit = queue.get()
+        if unit is None:
+            break
+        units.append(unit)
+    queue.broker.upload(uuid, ','.join(units))
+    queue.broker.done(uuid, None)
+
+
+def test_broker():
+
+    supervisor = FakeSupervisor(['a', 'b', 'c'])
+    try:
+        broker = Broker(supervisor, ('localhost', 0), 'secret')
+        student = multiprocessing.Process(target=_student,
+            args=(broker.address, 'secret', 'remote'))
+        student.start()
+        # act as the Supervisor
+        while True:
+            id, kind, output = supervisor.output_queue.get(timeout=10)
+            assert_equal(id, 'remote')
+            if kind == HIRE:
+                assert_true(broker.students[id].is_alive())
+            elif kind == REQUEST:
+                broker.students[id].replies.put(
+                    supervisor.scheduler.request(id))
+            else:
+                assert_equal(kind, DONE)
+                break
+        student.join()
+        with open(output[1]) as f:
+            assert_equal(f.read(), 'a,b,c')
+        broker.close()
+    finally:
+        shutil.rmtree(supervisor.outputpath)
+
+
+def test_broker_dismiss():
+
+    supervisor = FakeSupervisor(['a'])
+    try:
+        broker = Broker(supervisor, ('localhost', 0), 'secret')
+        assert_true(broker.hire('replaced'))
+        # unknown students and students that were replaced get no work
+        broker.heartbeat(['replaced', 'unknown'])
+        assert_equal(broker.request('unknown'), None)
+        broker.dismiss('replaced')
+        assert_equal(broker.request('replaced'), None)
+        broker.close()
+    finally:
+        shutil.rmtree(supervisor.outputpath)
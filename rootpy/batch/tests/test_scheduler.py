@@ -0,0 +1,51 @@
+# Copyright 2012 the rootpy developers
+# distributed under the terms of the GNU General Public License
+"""
+Tests for the scheduling of work units between students.
+"""
+from rootpy.batch.scheduler import Scheduler, WAIT
+
+from nose.tools import assert_equal, assert_true, assert_false
+
+
+def test_dynamic():
+
+    scheduler = Scheduler(['a', 'b', 'c'])
+    assert_equal(scheduler.request('fast'), 'a')
+    assert_equal(scheduler.request('slow'), 'b')
+    # the fast student takes the remaining unit
+    assert_equal(scheduler.request('fast'), 'c')
+    # no pending units but the slow student may still fail
+    assert_true(scheduler.request('fast') is WAIT)
+    assert_equal(scheduler.wake(), [])
+    # all units are done when the slow student finishes
+    assert_equal(scheduler.request('slow'), None)
+    assert_equal(scheduler.wake(), [('fast', None)])
+    assert_equal(scheduler.finish('fast'), ['a', 'c'])
+    assert_equal(scheduler.finish('slow'), ['b'])
+    assert_equal(len(scheduler), 0)
+
+
+def test_retry():
+
+    scheduler = Scheduler(['a', 'b'], retries=1)
+    assert_equal(scheduler.request('1'), 'a')
+    assert_equal(scheduler.request('2'), 'b')
+    assert_true(scheduler.request('1') is WAIT)
+    assert_true(scheduler.fail('2'))
+    assert_equal(scheduler.wake(), [('1', 'b')])
+    # b has now failed twice and is skipped but a is redone since the
+    # output of the failed student is lost
+    assert_true(scheduler.fail('1'))
+    assert_equal(scheduler.failed, ['b'])
+    assert_equal(list(scheduler.pending), ['a'])
+    assert_equal(scheduler.request('3'), 'a')
+    assert_equal(scheduler.request('3'), None)
+    assert_equal(scheduler.finish('3'), ['a'])
+
+
+def test_fail_without_units():
+
+    scheduler = Scheduler(['a'])
+    assert_false(scheduler.fail('1'))
+    assert_equal(list(scheduler.pending), ['a'])
@@ -0,0 +1,43 @@
+# Copyright 2012 the rootpy developers
+# distributed under the terms of the GNU General Public License
+"""
+Tests for histograms filled in shared memory.
+"""
+from rootpy.batch.shared import SharedHist
+from rootpy.plotting import Hist2D
+
+from nose.tools import assert_equal
+from nose.plugins.skip import SkipTest
+
+import multiprocessing
+
+
+def _fill(shared, value):
+
+    for _ in xrange(10):
+        shared.Fill(value, value)
+    shared.commit()
+
+
+def test_shared_hist():
+
+    try:
+        __import__('numpy')
+    except ImportError:
+        raise SkipTest("numpy is not installed")
+    shared = SharedHist(Hist2D(4, 0, 4, 4, 0, 4, name='shared'), slabs=2)
+    processes = [multiprocessing.Process(target=_fill, args=(shared, i))
+                 for i in xrange(4)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    # the histogram of this process is empty
+    assert_equal(shared.GetEntries(), 0)
+    hist = shared.result()
+    assert_equal(hist.GetName(), 'shared')
+    assert_equal(hist.GetEntries(), 40)
+    assert_equal(hist.Integral(), 40)
+    for i in xrange(4):
+        assert_equal(hist.GetBinContent(i + 1, i + 1), 10)
+    assert_equal(hist.GetMean(1), 1.5)
@@ -0,0 +1,172 @@
+# Copyright 2012 the rootpy developers
+# distributed under the terms of the GNU General Public License
+"""
+This module implements a persistent catalog of file metadata (the trees in
+each file with their number of entries and compressed size) that is used
+to balance the work between partitions of files without reopening every
+file each time.
+"""
+import os
+import cPickle as pickle
+import heapq
+import tempfile
+from collections import namedtuple
+
+from ..extern.lockfile import LockFile
+from .. import log; log = log[__name__]
+
+__all__ = [
+    'FileInfo',
+    'Catalog',
+    'get_catalog',
+    'partition',
+]
+
+
+FileInfo = namedtuple('FileInfo', 'path size mtime trees')
+
+
+class Catalog(object):
+    """
+    A dictionary-like catalog of :class:`FileInfo` keyed by file path and
+    stored in a pickle file. Entries are recomputed when the size or
+    modification time of a file changes.
+
+    Parameters
+    ----------
+    filename : str, optional (default=None)
+        The file the catalog is stored in. By default the catalog is stored
+        in the rootpy user data directory.
+    """
+    def __init__(self, filename=None):
+
+        if filename is None:
+            from .. import userdata
+            filename = os.path.join(userdata.DATA_ROOT, 'catalog.pickle')
+        self.filename = filename
+        self._infos = {}
+        self._modified = False
+        self._load()
+
+    def _load(self):
+
+        try:
+            with open(self.filename, 'rb') as f:
+                self._infos = pickle.load(f)
+        except (IOError, EOFError, pickle.UnpicklingError):
+            self._infos = {}
+
+    def save(self):
+        """
+        Write any new entries to the catalog file. Entries written
+        concurrently by other processes are preserved.
+        """
+        if not self._modified:
+            return
+        dirname = os.path.dirname(os.path.abspath(self.filename))
+        with LockFile(self.filename + '.lock'):
+            infos = self._infos
+            self._load()
+            self._infos.update(infos)
+            fd, tmp = tempfile.mkstemp(dir=dirname)
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(self._infos, f, pickle.HIGHEST_PROTOCOL)
+            os.rename(tmp, self.filename)
+        self._modified = False
+
+    def get(self, path):
+        """
+        Return the :class:`FileInfo` for a file, reading the file only if it
+        is not in the catalog or was modified since.
+        """
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        info = self._infos.get(path, None)
+        if (info is not None and
+            info.size == stat.st_size and info.mtime == stat.st_mtime):
+            return info
+        info = FileInfo(path, stat.st_size, stat.st_mtime, _read_trees(path))
+        self._infos[path] = info
+        self._modified = True
+        return info
+
+    def __getitem__(self, path):
+
+        return self.get(path)
+
+    def entries(self, path, treename):
+        """
+        Return the number of entries in a tree of a file or zero if the tree
+        does not exist
+        """
+        return self.get(path).trees.get(treename, (0, 0))[0]
+
+    def zipbytes(self, path, treename):
+        """
+        Return the compressed size in bytes of a tree of a file or zero if
+        the tree does not exist
+        """
+        return self.get(path).trees.get(treename, (0, 0))[1]
+
+
+def _read_trees(path):
+
+    from ..io import root_open, utils
+    from ..context import preserve_current_directory
+    trees = {}
+    with preserve_current_directory():
+        with root_open(path) as rfile:
+            for dirpath, dirnames, treenames in utils.walk(
+                    rfile, class_pattern='TTree'):
+                for treename in treenames:
+                    name = os.path.join(dirpath, treename)
+                    tree = rfile.Get(name)
+                    trees[name] = (tree.GetEntries(), tree.GetZipBytes())
+    return trees
+
+
+_CATALOG = None
+
+
+def get_catalog():
+    """
+    Return the default catalog stored in the rootpy user data directory
+    """
+    global _CATALOG
+    if _CATALOG is None:
+        _CATALOG = Catalog()
+    return _CATALOG
+
+
+def partition(items, weights, partitions):
+    """
+    Partition items with the longest-processing-time-first rule: the items
+    are sorted by decreasing weight and each is assigned to the partition
+    with the smallest total weight so far.
+
+    Parameters
+    ----------
+    items : list
+        The items to partition
+
+    weights : list
+        The weight (i.e. number of entries) of each item
+
+    partitions : int
+        The number of partitions
+
+    Returns
+    -------
+    partitions : list of lists
+        The items in each partition in their original order
+    """
+    if partitions < 1:
+        raise ValueError("the number of partitions must be at least 1")
+    order = sorted(xrange(len(items)), key=lambda i: weights[i], reverse=True)
+    heap = [(0, i) for i in xrange(partitions)]
+    assigned = [[] for _ in xrange(partitions)]
+    for i in order:
+        load, part = heapq.heappop(heap)
+        assigned[part].append(i)
+        heapq.heappush(heap, (load + weights[i], part))
+    return [[items[i] for i in sorted(indices)] for indices in assigned]
@@ -2,6 +2,8 @@
 # distributed under the terms of the GNU General Public License
 from collections import namedtuple
 
+from .. import log; log = log[__name__]
+
 
 Namedset = namedtuple('Namedset', 'name title label tags meta properties')
 Dataset = namedtuple('Dataset', Namedset._fields + ('datatype', 'classtype', 'weight'))
@@ -9,16 +11,54 @@ Dataset = namedtuple('Dataset', Namedset._fields + ('datatype', 'classtype', 'we
 
 class Fileset(namedtuple('Fileset', Dataset._fields + ('files', 'treename'))):
 
-    def split(self, partitions):
-
-        files = self.files[:]
-        fileset_files = [[] for _ in xrange(partitions)]
-        while len(files) > 0:
-            for fileset in fileset_files:
-                if len(files) > 0:
-                    fileset.append(files.pop(0))
-                else:
-                    break
+    def split(self, partitions, balance=False, catalog=None):
+        """
+        Split the files into a number of filesets
+
+        Parameters
+        ----------
+        partitions : int
+            The number of filesets
+
+        balance : bool, optional (default=False)
+            If True, balance the total number of entries in ``treename``
+            between the filesets instead of dealing out the files one by
+            one. The number of entries in each file is looked up in the
+            file metadata catalog and files are only opened if they are
+            not in the catalog or have been modified since.
+
+        catalog : Catalog, optional (default=None)
+            The file metadata catalog. By default the catalog in the rootpy
+            user data directory is used.
+
+        Returns
+        -------
+        filesets : list of Fileset
+        """
+        fileset_files = None
+        if balance:
+            from .catalog import get_catalog, partition
+            if catalog is None:
+                catalog = get_catalog()
+            try:
+                weights = [catalog.entries(filename, self.treename)
+                           for filename in self.files]
+            except (IOError, OSError) as e:
+                log.warning("could not read the number of entries in %s "
+                            "(%s), files will not be balanced" %
+                            (self.name, e))
+            else:
+                catalog.save()
+                fileset_files = partition(self.files, weights, partitions)
+        if fileset_files is None:
+            files = self.files[:]
+            fileset_files = [[] for _ in xrange(partitions)]
+            while len(files) > 0:
+                for fileset in fileset_files:
+                    if len(files) > 0:
+                        fileset.append(files.pop(0))
+                    else:
+                        break
         mydict = self._asdict()
         filesets = []
         for fileset in fileset_files:
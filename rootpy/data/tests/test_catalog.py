@@ -0,0 +1,56 @@
+# Copyright 2012 the rootpy developers
+# distributed under the terms of the GNU General Public License
+"""
+Tests for the file metadata catalog.
+"""
+from rootpy.data.catalog import Catalog, partition
+from rootpy.data.dataset import Fileset
+from rootpy.io import root_open
+from rootpy.tree import Tree
+
+from nose.tools import assert_equal
+
+import os
+import shutil
+import tempfile
+
+
+def test_partition():
+
+    items = ['a', 'b', 'c', 'd', 'e']
+    weights = [10, 1, 7, 3, 5]
+    parts = partition(items, weights, 2)
+    assert_equal(sorted(sum(parts, [])), items)
+    assert_equal(sorted(sum(weights[items.index(i)] for i in part)
+                        for part in parts), [13, 13])
+
+
+def test_catalog():
+
+    tmpdir = tempfile.mkdtemp()
+    try:
+        files = []
+        for i, entries in enumerate((100, 10, 10, 80)):
+            filename = os.path.join(tmpdir, 'file%d.root' % i)
+            with root_open(filename, 'recreate'):
+                tree = Tree('tree')
+                tree.create_branches({'x': 'F'})
+                for _ in xrange(entries):
+                    tree.fill()
+                tree.write()
+            files.append(filename)
+        catalog = Catalog(os.path.join(tmpdir, 'catalog.pickle'))
+        assert_equal(catalog.entries(files[0], 'tree'), 100)
+        assert_equal(catalog.entries(files[0], 'missing'), 0)
+        catalog.save()
+        # entries are read back from the catalog file
+        catalog = Catalog(catalog.filename)
+        assert_equal(catalog[files[3]].trees['tree'][0], 80)
+        fileset = Fileset(
+            name='test', title='test', label=None, tags=None, meta=None,
+            properties=None, datatype=None, classtype=None, weight=1.,
+            files=files, treename='tree')
+        filesets = fileset.split(2, balance=True, catalog=catalog)
+        assert_equal(sorted(len(f.files) for f in filesets), [1, 3])
+    finally:
+        shutil.rmtree(tmpdir)
@@ -7,3 +7,5 @@ class DoesNotExist(Exception):
 
 from .file import *
 from .utils import *
+from .merge import *
+from .pool import *
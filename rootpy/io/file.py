@@ -9,12 +9,13 @@ from ..core import Object
 from ..decorators import snake_case_methods
 from ..context import preserve_current_directory
 from .. import asrootpy, QROOT
-from . import utils, DoesNotExist
+from . import utils, index, DoesNotExist
 from ..util.path import expand as expand_path
 
 from rootpy import log
 from rootpy.memory.keepalive import keepalive
 
+import __builtin__
 import tempfile
 import os
 import warnings
@@ -178,6 +179,16 @@ class _DirectoryBase(Object):
         rootpy if one exists and ``rootpy=True``, otherwise return the
         unadulterated TObject.
         """
+        keyindex, path = index.lookup(self)
+        if keyindex is not None and ':' not in name:
+            objpath = os.path.normpath(
+                os.path.join(path, name.partition(';')[0]))
+            # paths above the top directory or in other files are left to ROOT
+            if (objpath.split(os.path.sep)[0] not in ('.', '..') and
+                    not keyindex.exists(objpath) and
+                    not self.FindObject(name)):
+                # neither written in the file nor held in memory
+                raise DoesNotExist
         thing = super(_DirectoryBase, self).Get(name)
         if not thing:
             raise DoesNotExist
@@ -211,6 +222,146 @@ class _DirectoryBase(Object):
             return asrootpy(rdir, **kwargs)
         return rdir
 
+    def get_many(self, paths, rootpy=True, readahead=False, **kwargs):
+        """
+        Return the objects at many paths. The keys of all objects are looked
+        up first and the objects are then read in the order of their
+        position in the file, so that the file is read sequentially instead
+        of with one random read per object.
+
+        Parameters
+        ----------
+        paths : list of str
+            The paths of the objects relative to this directory. A cycle may
+            be appended to the name of an object (i.e. ``hist;2``).
+
+        rootpy : bool, optional (default=True)
+            If True return the objects cast as their rootpy subclasses
+
+        readahead : bool, optional (default=False)
+            For local files, read the regions of the file containing the
+            objects in large sequential blocks before reading the objects.
+            The objects are already read in the order of their position in
+            the file, so this only helps on storage with a high latency per
+            read (i.e. network filesystems).
+
+        kwargs : dict, optional
+            Additional keyword arguments passed to asrootpy
+
+        Returns
+        -------
+        objects : list
+            The objects in the order of ``paths``
+        """
+        dirs = {}
+        keys = []
+        objects = [None] * len(paths)
+        for i, path in enumerate(paths):
+            dirname, _, name = os.path.normpath(
+                path.lstrip(os.path.sep)).rpartition(os.path.sep)
+            if dirname not in dirs:
+                tdir = self
+                if dirname:
+                    tdir = super(_DirectoryBase, self).GetDirectory(dirname)
+                if not tdir:
+                    raise DoesNotExist(
+                        "requested path '%s' does not exist in %s" %
+                        (path, self._path))
+                dirs[dirname] = tdir
+            name, _, cycle = name.partition(';')
+            key = dirs[dirname].GetKey(name, int(cycle) if cycle else 9999)
+            if not key:
+                raise DoesNotExist("requested path '%s' does not exist in %s" %
+                    (path, self._path))
+            if key.GetClassName().startswith('TDirectory'):
+                objects[i] = self.Get(path, rootpy=rootpy, **kwargs)
+                continue
+            keys.append((key.GetSeekKey(), i, key))
+        keys.sort()
+        filename = self.GetFile().GetName()
+        if readahead and keys and '://' not in filename:
+            _read_spans(filename, [(seek, seek + objkey.GetNbytes())
+                                   for seek, i, objkey in keys])
+        for seek, i, key in keys:
+            thing = key.ReadObj()
+            if not thing:
+                raise DoesNotExist("could not read '%s' in %s" %
+                    (paths[i], self._path))
+            keepalive(thing, self)
+            if rootpy:
+                thing = asrootpy(thing, **kwargs)
+            objects[i] = thing
+        return objects
+
+    def write_many(self, objects):
+        """
+        Write many objects into this directory. Missing directories are
+        created once and the objects are written directory by directory, so
+        the current directory is changed once per directory instead of once
+        per object.
+
+        Parameters
+        ----------
+        objects : dict
+            Map of the paths of the objects relative to this directory to
+            the objects
+        """
+        groups = defaultdict(list)
+        for path, thing in objects.items():
+            dirname, _, name = os.path.normpath(
+                path.lstrip(os.path.sep)).rpartition(os.path.sep)
+            groups[dirname].append((name, thing))
+        dirs = {'': self}
+        with preserve_current_directory():
+            for dirname in sorted(groups):
+                _mkdirs(dirs, dirname).cd()
+                for name, thing in groups[dirname]:
+                    thing.Write(name)
+
+
+def _mkdirs(dirs, path):
+    """
+    Return the directory at ``path``, creating it and its parents if
+    required. ``dirs`` maps the paths of the known directories to the
+    directories.
+    """
+    if path in dirs:
+        return dirs[path]
+    parent, _, name = path.rpartition(os.path.sep)
+    parent = _mkdirs(dirs, parent)
+    tdir = QROOT.TDirectoryFile.GetDirectory(parent, name)
+    if not tdir:
+        tdir = QROOT.TDirectoryFile.mkdir(parent, name)
+        if not tdir:
+            raise ValueError("could not create directory %s" % path)
+    dirs[path] = tdir
+    return tdir
+
+
+def _read_spans(filename, spans, gap=1048576, blocksize=16777216):
+    """
+    Read the regions ``spans`` (sorted (start, end) byte offsets) of a file
+    so that they are in the OS page cache when ROOT reads them. Regions
+    separated by less than ``gap`` bytes are read as one.
+    """
+    merged = []
+    for start, end in spans:
+        if merged and start - merged[-1][1] < gap:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    try:
+        with __builtin__.open(filename, 'rb') as infile:
+            for start, end in merged:
+                infile.seek(start)
+                while start < end:
+                    data = infile.read(min(blocksize, end - start))
+                    if not data:
+                        return
+                    start += len(data)
+    except (IOError, OSError) as e:
+        log.warning("could not read ahead in %s: %s" % (filename, e))
+
 
 @snake_case_methods
 class Directory(_DirectoryBase, QROOT.TDirectoryFile):
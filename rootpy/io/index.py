@@ -0,0 +1,263 @@
+# Copyright 2012 the rootpy developers
+# distributed under the terms of the GNU General Public License
+"""
+This module implements an opt-in persistent index of the keys of ROOT
+files. The index of a file lists the path, class name, cycle, size and seek
+offset of each key. It is built once by reading the keys of all directories
+and stored in a sidecar file in the rootpy user data directory, where it is
+reused while the size and modification time of the file are unchanged::
+
+    from rootpy.io import index
+    index.enable()
+
+While enabled, :func:`rootpy.io.utils.walk` (and so ``File.walk`` and
+``File.find``) list directories from the index without reading them, and
+``Get`` raises DoesNotExist for missing paths without searching the file.
+Only files opened read-only from local storage are indexed.
+"""
+import os
+import hashlib
+import tempfile
+import cPickle as pickle
+from fnmatch import fnmatch
+
+from .. import log; log = log[__name__]
+
+__all__ = [
+    'KeyIndex',
+    'enable',
+    'disable',
+    'lookup',
+]
+
+# increment when the format of the stored indexes changes
+VERSION = 1
+
+
+class KeyIndex(object):
+    """
+    The keys of a ROOT file
+
+    Parameters
+    ----------
+    keys : dict
+        Map of the path of each object (without a leading slash) to a tuple
+        of its class name, cycle, uncompressed size, size on disk and seek
+        offset. Only the highest cycle of each name is listed.
+
+    dirs : dict
+        Map of the path of each directory ('' for the top directory) to the
+        names of the keys in that directory
+    """
+    def __init__(self, keys, dirs):
+
+        self.keys = keys
+        self.dirs = dirs
+
+    @classmethod
+    def build(cls, tdirectory):
+        """
+        Build the index of a file by reading the keys of all directories
+        """
+        keys = {}
+        dirs = {}
+        cls._scan(tdirectory, '', keys, dirs)
+        return cls(keys, dirs)
+
+    @classmethod
+    def _scan(cls, tdirectory, path, keys, dirs):
+
+        names = []
+        subdirs = []
+        for key in tdirectory.GetListOfKeys():
+            name = key.GetName()
+            objpath = '%s/%s' % (path, name) if path else name
+            cycle = key.GetCycle()
+            if objpath in keys:
+                if keys[objpath][1] >= cycle:
+                    continue
+            else:
+                names.append(name)
+            classname = key.GetClassName()
+            keys[objpath] = (classname, cycle, key.GetObjlen(),
+                             key.GetNbytes(), key.GetSeekKey())
+            if classname.startswith('TDirectory'):
+                subdirs.append((objpath, key))
+        dirs[path] = names
+        for objpath, key in subdirs:
+            cls._scan(key.ReadObj(), objpath, keys, dirs)
+
+    def __len__(self):
+
+        return len(self.keys)
+
+    def __contains__(self, path):
+
+        return path.strip('/') in self.keys
+
+    def exists(self, path):
+        """
+        Return True if a key exists at this path
+        """
+        return path.strip('/') in self.keys
+
+    def isdir(self, path):
+        """
+        Return True if this path is a directory
+        """
+        return path.strip('/') in self.dirs
+
+    def classname(self, path):
+        """
+        Return the class name of the key at this path
+        """
+        return self.keys[path.strip('/')][0]
+
+    def seek(self, path):
+        """
+        Return the seek offset of the key at this path
+        """
+        return self.keys[path.strip('/')][4]
+
+    def listdir(self, path=''):
+        """
+        Return the names of the subdirectories and a list of (name,
+        classname) of the other keys in a directory
+        """
+        path = path.strip('/')
+        dirnames, objects = [], []
+        for name in self.dirs[path]:
+            classname = self.keys['%s/%s' % (path, name) if path else name][0]
+            if classname.startswith('TDirectory'):
+                dirnames.append(name)
+            objects.append((name, classname))
+        return dirnames, objects
+
+    def walk(self, top, dirpath, depth=0, maxdepth=-1,
+             class_pattern=None, return_classname=False,
+             treat_dirs_as_objs=False):
+        """
+        The equivalent of :func:`rootpy.io.utils.walk` for the directory
+        ``top`` of the file (yielding ``dirpath`` as its path)
+        """
+        dirnames, objects = self.listdir(top)
+        objectnames = []
+        for name, classname in objects:
+            if classname.startswith('TDirectory') and not treat_dirs_as_objs:
+                continue
+            if class_pattern is not None:
+                if not fnmatch(classname, class_pattern):
+                    continue
+            objectnames.append(
+                name if not return_classname else (name, classname))
+        yield dirpath, dirnames, objectnames
+        if depth == maxdepth:
+            return
+        for dirname in dirnames:
+            for x in self.walk(os.path.join(top, dirname),
+                               os.path.join(dirpath, dirname),
+                               depth=depth + 1,
+                               maxdepth=maxdepth,
+                               class_pattern=class_pattern,
+                               return_classname=return_classname,
+                               treat_dirs_as_objs=treat_dirs_as_objs):
+                yield x
+
+
+class KeyIndexStore(object):
+    """
+    A directory of stored key indexes
+
+    Parameters
+    ----------
+    path : str, optional (default=None)
+        The directory. By default the directory ``keyindex`` in the rootpy
+        user data directory is used.
+    """
+    def __init__(self, path=None):
+
+        if path is None:
+            from .. import userdata
+            path = os.path.join(userdata.DATA_ROOT, 'keyindex')
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        self.path = path
+        self._indexes = {}
+
+    def get(self, tfile):
+        """
+        Return the index of a file or None if the file is not opened
+        read-only from local storage
+        """
+        if tfile.IsWritable() or '://' in tfile.GetName():
+            return None
+        filename = os.path.abspath(tfile.GetName())
+        try:
+            stat = os.stat(filename)
+        except OSError:
+            return None
+        fingerprint = (filename, stat.st_size, stat.st_mtime)
+        index = self._indexes.get(fingerprint)
+        if index is not None:
+            return index
+        path = os.path.join(self.path,
+                            hashlib.sha1(filename).hexdigest() + '.pickle')
+        try:
+            with open(path, 'rb') as f:
+                version, stored, keys, dirs = pickle.load(f)
+            if version == VERSION and stored == fingerprint:
+                index = KeyIndex(keys, dirs)
+        except (IOError, EOFError, ValueError, pickle.UnpicklingError):
+            pass
+        if index is None:
+            log.info("indexing the keys of %s" % filename)
+            index = KeyIndex.build(tfile)
+            fd, tmp = tempfile.mkstemp(suffix='.pickle', dir=self.path)
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump((VERSION, fingerprint, index.keys, index.dirs),
+                            f, pickle.HIGHEST_PROTOCOL)
+            os.rename(tmp, path)
+        # forget the indexes of previous versions of this file
+        for key in self._indexes.keys():
+            if key[0] == filename:
+                del self._indexes[key]
+        self._indexes[fingerprint] = index
+        return index
+
+
+_STORE = None
+
+
+def enable(path=None):
+    """
+    Use key indexes stored in the directory ``path`` (by default in the
+    rootpy user data directory)
+    """
+    global _STORE
+    _STORE = KeyIndexStore(path=path)
+    return _STORE
+
+
+def disable():
+    """
+    Stop using key indexes
+    """
+    global _STORE
+    _STORE = None
+
+
+def lookup(tdirectory):
+    """
+    Return the index of the file containing a directory and the path of the
+    directory in the file, or (None, None) if indexes are disabled or the
+    file cannot be indexed
+    """
+    if _STORE is None:
+        return None, None
+    tfile = tdirectory.GetFile()
+    if not tfile:
+        return None, None
+    index = _STORE.get(tfile)
+    if index is None:
+        return None, None
+    return index, tdirectory.GetPath().rpartition(':/')[2]
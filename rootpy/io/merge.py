@@ -0,0 +1,275 @@
+# Copyright 2012 the rootpy developers
+# distributed under the terms of the GNU General Public License
+"""
+This module merges ROOT files in-process with ROOT's TFileMerger (the engine
+behind hadd) instead of running hadd in a subprocess. Large numbers of files
+are merged with a tree reduction over a pool of processes.
+"""
+import ROOT
+
+import os
+import shutil
+import tempfile
+import threading
+import multiprocessing
+from collections import defaultdict
+
+from .. import log; log = log[__name__]
+
+__all__ = [
+    'merge_files',
+    'IncrementalMerger',
+]
+
+
+def _merge(args):
+
+    inputs, output, fast = args
+    merger = ROOT.TFileMerger(False, False)
+    # fast cloning copies the compressed baskets of trees without
+    # decompressing and recompressing them
+    merger.SetFastMethod(fast)
+    merger.SetPrintLevel(0)
+    if not merger.OutputFile(output, 'RECREATE'):
+        raise IOError("could not create file: %s" % output)
+    for filename in inputs:
+        if not merger.AddFile(filename, False):
+            raise IOError("could not open file: %s" % filename)
+    if not merger.Merge():
+        raise RuntimeError("failed to merge into %s" % output)
+    return output
+
+
+def _partition(items, ngroups):
+
+    size, extra = divmod(len(items), ngroups)
+    groups = []
+    start = 0
+    for i in xrange(ngroups):
+        stop = start + size + (1 if i < extra else 0)
+        groups.append(items[start:stop])
+        start = stop
+    return groups
+
+
+def merge_files(inputs, output,
+                processes=1,
+                group_size=100,
+                fast=True,
+                tmpdir=None):
+    """
+    Merge ROOT files like hadd, but in-process
+
+    Inputs are merged in groups of at most ``group_size`` files into
+    temporary files by a pool of processes, and the temporary files are then
+    merged again in the same way until a single group is left that is merged
+    into ``output``. Each entry is therefore rewritten only
+    log(N)/log(``group_size``) times instead of once per group of files.
+
+    Parameters
+    ----------
+    inputs : list
+        The files to merge
+
+    output : str
+        The output file name. Any existing file is overwritten.
+
+    processes : int, optional (default=1)
+        The number of processes merging groups of files in parallel
+
+    group_size : int, optional (default=100)
+        The maximum number of files merged at once
+
+    fast : bool, optional (default=True)
+        Use fast cloning of the baskets of trees
+
+    tmpdir : str, optional (default=None)
+        Directory where the intermediate files are written. By default the
+        directory containing ``output`` is used.
+    """
+    if not inputs:
+        raise ValueError("no input files")
+    if group_size < 2:
+        raise ValueError("group_size must be at least 2")
+    if len(inputs) == 1:
+        # simple copy
+        shutil.copy(inputs[0], output)
+        return
+    if tmpdir is None:
+        tmpdir = os.path.dirname(os.path.abspath(output))
+    pool = None
+    if processes > 1:
+        pool = multiprocessing.Pool(processes)
+    level = list(inputs)
+    temporary = False
+    try:
+        while True:
+            # the pool only sets how many of these groups are merged at once
+            ngroups = -(-len(level) // group_size)
+            if ngroups == 1:
+                log.info("merging %i files into %s" % (len(level), output))
+                _merge((level, output, fast))
+                break
+            log.info("merging %i files in %i groups" % (len(level), ngroups))
+            tasks = []
+            for group in _partition(level, ngroups):
+                fd, path = tempfile.mkstemp(suffix='.root', dir=tmpdir)
+                os.close(fd)
+                tasks.append((group, path, fast))
+            try:
+                if pool is not None:
+                    outputs = pool.map(_merge, tasks)
+                else:
+                    outputs = map(_merge, tasks)
+            except:
+                for _, path, _ in tasks:
+                    os.unlink(path)
+                raise
+            if temporary:
+                for path in level:
+                    os.unlink(path)
+            level = outputs
+            temporary = True
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+        if temporary:
+            for path in level:
+                if os.path.exists(path):
+                    os.unlink(path)
+
+
+class IncrementalMerger(object):
+    """
+    Merge files in the background as they are produced
+
+    Files are added to the lowest level of a tree reduction. As soon as
+    ``group_size`` files are waiting at a level they are merged by a pool of
+    processes into a temporary file that is added to the next level. When
+    all files have been added, ``finish`` only merges the few files left at
+    each level into the output.
+
+    Parameters
+    ----------
+    group_size : int, optional (default=4)
+        The number of files merged at once
+
+    processes : int, optional (default=1)
+        The number of processes merging groups of files in the background
+
+    fast : bool, optional (default=True)
+        Use fast cloning of the baskets of trees
+
+    tmpdir : str, optional (default=None)
+        Directory where the intermediate files are written. By default the
+        current directory is used.
+
+    delete_inputs : bool, optional (default=False)
+        Delete the added files as soon as they have been merged
+    """
+    def __init__(self,
+                 group_size=4,
+                 processes=1,
+                 fast=True,
+                 tmpdir=None,
+                 delete_inputs=False):
+
+        if group_size < 2:
+            raise ValueError("group_size must be at least 2")
+        self.group_size = group_size
+        self.fast = fast
+        self.tmpdir = tmpdir
+        self.delete_inputs = delete_inputs
+        self._levels = defaultdict(list)
+        self._results = []
+        self._lock = threading.RLock()
+        self._pool = multiprocessing.Pool(processes)
+
+    def add(self, filename, level=0):
+        """
+        Add a file to be merged
+        """
+        with self._lock:
+            files = self._levels[level]
+            files.append(filename)
+            if len(files) < self.group_size:
+                return
+            del self._levels[level]
+            fd, path = tempfile.mkstemp(suffix='.root', dir=self.tmpdir)
+            os.close(fd)
+            log.info("merging %i files in the background" % len(files))
+            self._results.append((self._pool.apply_async(
+                _merge, ((files, path, self.fast),),
+                callback=lambda output: self._merged(files, output, level)),
+                path))
+
+    def _merged(self, inputs, output, level):
+
+        # called in the result handler thread of the pool
+        self._remove(inputs, level)
+        self.add(output, level + 1)
+
+    def _remove(self, filenames, level):
+
+        if level > 0 or self.delete_inputs:
+            for filename in filenames:
+                os.unlink(filename)
+
+    def wait(self):
+        """
+        Wait until all merges in the background are done
+        """
+        while True:
+            with self._lock:
+                if not self._results:
+                    return
+                result, path = self._results.pop(0)
+            try:
+                # the callback has run once get() returns
+                result.get()
+            except:
+                if os.path.exists(path):
+                    os.unlink(path)
+                raise
+
+    def finish(self, output):
+        """
+        Merge all remaining files into ``output``. Any existing file is
+        overwritten.
+        """
+        self.wait()
+        self._pool.close()
+        self._pool.join()
+        levels = sorted(self._levels.items(), reverse=True)
+        inputs = [filename for level, files in levels for filename in files]
+        if not inputs:
+            raise ValueError("no input files")
+        log.info("merging %i files into %s" % (len(inputs), output))
+        if len(inputs) == 1 and (levels[0][0] > 0 or self.delete_inputs):
+            shutil.move(inputs[0], output)
+        else:
+            if len(inputs) == 1:
+                shutil.copy(inputs[0], output)
+            else:
+                _merge((inputs, output, self.fast))
+            for level, files in levels:
+                self._remove(files, level)
+        self._levels.clear()
+
+    def close(self):
+        """
+        Stop merging and remove the intermediate files. Files that were
+        added but not merged yet are left alone.
+        """
+        self._pool.terminate()
+        self._pool.join()
+        for result, path in self._results:
+            if os.path.exists(path):
+                os.unlink(path)
+        del self._results[:]
+        for level, files in self._levels.items():
+            if level > 0:
+                for filename in files:
+                    os.unlink(filename)
+                del self._levels[level]
@@ -0,0 +1,279 @@
+# Copyright 2012 the rootpy developers
+# distributed under the terms of the GNU General Public License
+"""
+This module implements a process-wide pool of open ROOT files. Files are
+opened on first use and kept open for later uses, but at most ``max_open``
+files are kept open: the least recently used files that are not in use are
+closed when the limit is exceeded::
+
+    from rootpy.io.pool import get_pool
+
+    pool = get_pool()
+    with pool.open('sample.root') as f:
+        hist = f.Get('hist')
+
+A file is in use while a handle to it is open or while an object read from
+it with the ``Get`` method of a handle or of a :class:`PooledDirectory` is
+alive, since closing the file would delete the object.
+"""
+import os
+import weakref
+import threading
+from collections import OrderedDict
+
+import ROOT
+
+from .file import root_open
+from .utils import splitfile
+from .. import log; log = log[__name__]
+
+__all__ = [
+    'FilePool',
+    'PooledDirectory',
+    'get_pool',
+]
+
+
+class FileHandle(object):
+    """
+    A reference to a file of a pool. Use it as a context manager or call
+    ``close`` to release it. Attributes of the file may be accessed through
+    the handle. Objects read with ``Get`` or ``get`` or as attributes of the
+    handle keep the file open while they are alive.
+    """
+    def __init__(self, pool, key, rfile):
+
+        self.pool = pool
+        self.key = key
+        self.file = rfile
+        self.closed = False
+
+    def __getattr__(self, attr):
+
+        thing = getattr(self.file, attr)
+        if isinstance(thing, ROOT.TObject):
+            # an object read from the file
+            self.pool._track(self.key, thing)
+        return thing
+
+    def __enter__(self):
+
+        return self
+
+    def __exit__(self, type, value, traceback):
+
+        self.close()
+        return False
+
+    def close(self):
+        """
+        Release the file. The file stays open in the pool.
+        """
+        if not self.closed:
+            self.closed = True
+            self.pool._release(self.key)
+
+    def Get(self, path, **kwargs):
+        """
+        Return the object at ``path`` in the file. The file is kept open at
+        least as long as the object.
+        """
+        thing = self.file.Get(path, **kwargs)
+        self.pool._track(self.key, thing)
+        return thing
+
+    get = Get
+
+
+def _fingerprint(filename):
+
+    try:
+        stat = os.stat(filename)
+    except OSError:
+        return None
+    return stat.st_size, stat.st_mtime
+
+
+class FilePool(object):
+    """
+    A pool of open ROOT files
+
+    Parameters
+    ----------
+    max_open : int, optional (default=256)
+        The maximum number of files kept open. More files are open while
+        more files are in use.
+
+    Files that have changed on disk since they were opened are reopened
+    when they are not in use. A file is open in one mode at a time: it is
+    reopened when it is requested in another mode, which is not possible
+    while it is in use.
+    """
+    def __init__(self, max_open=256):
+
+        if max_open < 1:
+            raise ValueError("max_open must be at least 1")
+        self.max_open = max_open
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # files in order of last use (most recently used last)
+        self._files = OrderedDict()
+        self._refs = {}
+        self._fingerprints = {}
+        self._modes = {}
+        # the objects read from each file (which keep it open)
+        self._patients = {}
+        self._lock = threading.RLock()
+
+    def __len__(self):
+
+        return len(self._files)
+
+    def __contains__(self, filename):
+
+        return os.path.abspath(filename) in self._files
+
+    def open(self, filename, mode=''):
+        """
+        Return a handle to a file, opening it if it is not open in the pool
+        """
+        mode = mode.lower()
+        if mode == 'read':
+            mode = ''
+        key = os.path.abspath(filename)
+        with self._lock:
+            rfile = self._files.get(key)
+            if rfile is not None and rfile.IsOpen():
+                if mode != self._modes[key]:
+                    if self._in_use(key):
+                        raise ValueError(
+                            "file %s is in use in another mode" % filename)
+                    self._patients.pop(key, None)
+                    rfile.Close()
+                elif (not mode and
+                        _fingerprint(key) != self._fingerprints[key] and
+                        not self._in_use(key)):
+                    # reopen files changed on disk since they were opened
+                    self._patients.pop(key, None)
+                    rfile.Close()
+            self._files.pop(key, None)
+            if rfile is not None and rfile.IsOpen():
+                self.hits += 1
+            else:
+                self.misses += 1
+                rfile = root_open(filename, mode)
+                self._fingerprints[key] = _fingerprint(key)
+                self._modes[key] = mode
+            self._files[key] = rfile
+            self._refs[key] = self._refs.get(key, 0) + 1
+            self._evict()
+        return FileHandle(self, key, rfile)
+
+    def _release(self, key):
+
+        with self._lock:
+            self._refs[key] -= 1
+            if not self._refs[key]:
+                del self._refs[key]
+            self._evict()
+
+    def _track(self, key, thing):
+
+        with self._lock:
+            patients = self._patients.get(key)
+            if patients is None:
+                patients = self._patients[key] = weakref.WeakSet()
+            patients.add(thing)
+
+    def _in_use(self, key):
+
+        return key in self._refs or bool(self._patients.get(key))
+
+    def _evict(self):
+
+        if len(self._files) <= self.max_open:
+            return
+        for key in self._files.keys():
+            if len(self._files) <= self.max_open:
+                break
+            if self._in_use(key):
+                continue
+            rfile = self._files.pop(key)
+            del self._fingerprints[key]
+            del self._modes[key]
+            self._patients.pop(key, None)
+            if rfile.IsOpen():
+                rfile.Close()
+            self.evictions += 1
+        if len(self._files) > self.max_open:
+            log.debug("%i files are in use (max_open is %i)" %
+                (len(self._files), self.max_open))
+
+    def close(self):
+        """
+        Close all files that are not in use
+        """
+        with self._lock:
+            max_open, self.max_open = self.max_open, 0
+            try:
+                self._evict()
+            finally:
+                self.max_open = max_open
+
+    def stats(self):
+        """
+        Return the numbers of hits, misses, evictions and open files
+        """
+        return dict(hits=self.hits, misses=self.misses,
+                    evictions=self.evictions, open=len(self._files))
+
+
+class PooledDirectory(object):
+    """
+    A directory of a file of a pool, opened on each call to ``Get``
+
+    Parameters
+    ----------
+    path : str
+        The name of the file optionally followed by ``:/`` and the path of
+        the directory in the file
+
+    pool : FilePool, optional (default=None)
+        The pool. By default the process-wide pool is used.
+    """
+    def __init__(self, path, pool=None):
+
+        self.filename, self.dirpath = splitfile(path)
+        self.dirpath = self.dirpath.lstrip(os.path.sep)
+        self.pool = pool
+
+    def __str__(self):
+
+        if self.dirpath:
+            return "%s:/%s" % (self.filename, self.dirpath)
+        return self.filename
+
+    def Get(self, path, **kwargs):
+        """
+        Return the object at ``path`` in this directory. The file is kept
+        open at least as long as the object.
+        """
+        pool = self.pool
+        if pool is None:
+            pool = get_pool()
+        with pool.open(self.filename) as handle:
+            return handle.Get(os.path.join(self.dirpath, path), **kwargs)
+
+
+_POOL = None
+
+
+def get_pool():
+    """
+    Return the process-wide pool
+    """
+    global _POOL
+    if _POOL is None:
+        _POOL = FilePool()
+    return _POOL
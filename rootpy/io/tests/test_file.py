@@ -5,7 +5,8 @@ Tests for the file module.
 """
 
 from rootpy.context import invisible_canvas
-from rootpy.io import TemporaryFile, DoesNotExist
+from rootpy.io import (TemporaryFile, DoesNotExist, root_open, merge_files,
+                       IncrementalMerger, FilePool, PooledDirectory, index)
 from rootpy.plotting import Hist
 from rootpy.testdata import get_file
 
@@ -13,6 +14,8 @@ from nose.tools import assert_raises, assert_equals
 
 import gc
 import os
+import shutil
+import tempfile
 
 import ROOT as R
 
@@ -68,6 +71,173 @@ def test_file_attr():
         f.hello.something = h
         assert_equals(f['hello/something'].name, 'test')
 
+def test_merge_files():
+
+    tmpdir = tempfile.mkdtemp()
+    try:
+        inputs = []
+        for i in xrange(7):
+            filename = os.path.join(tmpdir, 'input%d.root' % i)
+            with root_open(filename, 'recreate'):
+                h = Hist(10, 0, 1, name='hist')
+                h.Fill(.5, i + 1)
+                h.Write()
+            inputs.append(filename)
+        output = os.path.join(tmpdir, 'output.root')
+        merge_files(inputs, output, group_size=3)
+        with root_open(output) as f:
+            assert_equals(f.hist.Integral(), 28)
+        # only the inputs and the output remain
+        assert_equals(len(os.listdir(tmpdir)), 8)
+        # the number of processes does not change the groups
+        merge_files(inputs, output, processes=2, group_size=4)
+        with root_open(output) as f:
+            assert_equals(f.hist.Integral(), 28)
+        assert_equals(len(os.listdir(tmpdir)), 8)
+    finally:
+        shutil.rmtree(tmpdir)
+
+def test_incremental_merger():
+
+    tmpdir = tempfile.mkdtemp()
+    try:
+        merger = IncrementalMerger(group_size=2, tmpdir=tmpdir,
+                                   delete_inputs=True)
+        for i in xrange(5):
+            filename = os.path.join(tmpdir, 'input%d.root' % i)
+            with root_open(filename, 'recreate'):
+                h = Hist(10, 0, 1, name='hist')
+                h.Fill(.5, i + 1)
+                h.Write()
+            merger.add(filename)
+        output = os.path.join(tmpdir, 'output.root')
+        merger.finish(output)
+        merger.close()
+        with root_open(output) as f:
+            assert_equals(f.hist.Integral(), 15)
+        # the inputs and intermediate files were deleted
+        assert_equals(os.listdir(tmpdir), ['output.root'])
+    finally:
+        shutil.rmtree(tmpdir)
+
+def test_get_many():
+
+    with TemporaryFile() as f:
+        f.mkdir('a').cd()
+        for i in xrange(5):
+            h = Hist(1, 0, 1, name='hist%d' % i)
+            h.Fill(.5, i)
+            h.Write()
+        f.cd()
+        paths = ['a/hist%d' % i for i in reversed(xrange(5))] + ['a']
+        things = f.get_many(paths)
+        assert_equals([thing.__class__.__name__ for thing in things],
+                      ['Hist'] * 5 + ['Directory'])
+        assert_equals([thing.Integral() for thing in things[:5]],
+                      [4, 3, 2, 1, 0])
+        assert_raises(DoesNotExist, f.get_many, ['a/hist1', 'a/nothing'])
+        assert_raises(DoesNotExist, f.get_many, ['a/hist1', 'b/hist1'])
+        things = f.get_many(paths, readahead=True)
+        assert_equals([thing.Integral() for thing in things[:5]],
+                      [4, 3, 2, 1, 0])
+
+def test_write_many():
+
+    with TemporaryFile() as f:
+        f.mkdir('a')
+        objects = {}
+        for path in ('hist', 'a/hist', 'a/b/hist', 'c/d/hist'):
+            objects[path] = Hist(1, 0, 1, name='test')
+        f.write_many(objects)
+        for path in objects:
+            assert_equals(f.Get(path).name, 'test')
+        assert_equals(len(f.a.keys()), 2)
+
+def test_file_pool():
+
+    tmpdir = tempfile.mkdtemp()
+    try:
+        filenames = []
+        for i in xrange(3):
+            filename = os.path.join(tmpdir, 'input%d.root' % i)
+            with root_open(filename, 'recreate'):
+                Hist(1, 0, 1, name='hist').Write()
+            filenames.append(filename)
+        pool = FilePool(max_open=2)
+        for filename in filenames + filenames[-1:]:
+            with pool.open(filename) as f:
+                assert f.IsOpen()
+        assert_equals(pool.stats(), dict(hits=1, misses=3, evictions=1,
+                                         open=2))
+        assert filenames[0] not in pool
+        # a file is not closed while an object read from it is alive
+        hist = PooledDirectory(filenames[0], pool=pool).Get('hist')
+        with pool.open(filenames[1]):
+            pass
+        assert filenames[0] in pool
+        assert_equals(hist.GetEntries(), 0)
+        del hist
+        gc.collect()
+        # so do objects read through a handle
+        for read in (lambda f: f.Get('hist'), lambda f: f.get('hist'),
+                     lambda f: f.hist):
+            with pool.open(filenames[2]) as f:
+                hist = read(f)
+            pool.close()
+            assert_equals(len(pool), 1)
+            assert filenames[2] in pool
+            # a file cannot be reopened in another mode while in use
+            assert_raises(ValueError, pool.open, filenames[2], 'update')
+            del hist
+            gc.collect()
+        pool.close()
+        assert_equals(len(pool), 0)
+        # a file is reopened when it is requested in another mode
+        with pool.open(filenames[0]) as f:
+            assert not f.IsWritable()
+        with pool.open(filenames[0], 'update') as f:
+            assert f.IsWritable()
+        assert_equals(len(pool), 1)
+        pool.close()
+    finally:
+        shutil.rmtree(tmpdir)
+
+def test_key_index():
+
+    tmpdir = tempfile.mkdtemp()
+    try:
+        filename = os.path.join(tmpdir, 'test.root')
+        with root_open(filename, 'recreate') as f:
+            f.mkdir('a').cd()
+            Hist(1, 0, 1, name='hist1').Write()
+            f.a.mkdir('b').cd()
+            Hist(1, 0, 1, name='hist2').Write()
+        with root_open(filename) as f:
+            expected = list(f.walk(return_classname=True))
+        store = index.enable(os.path.join(tmpdir, 'index'))
+        try:
+            with root_open(filename) as f:
+                assert_equals(list(f.walk(return_classname=True)), expected)
+                assert_equals(list(f.a.walk()), [
+                    ('a', ['b'], ['hist1']), ('a/b', [], ['hist2'])])
+                assert_equals([path for path, match in f.find('hist2')],
+                              ['/a/b/hist2'])
+                assert_raises(DoesNotExist, f.Get, 'a/b/hist3')
+                assert_equals(f.Get('a/b/hist2').name, 'hist2')
+                # paths relative to subdirectories
+                assert_equals(f.a.b.Get('../hist1').name, 'hist1')
+            # the stored index is reused
+            store._indexes.clear()
+            with root_open(filename) as f:
+                keyindex, path = index.lookup(f.a)
+                assert_equals(path, 'a')
+                assert_equals(len(keyindex), 4)
+                assert_equals(keyindex.classname('a/hist1'), 'TH1F')
+        finally:
+            index.disable()
+    finally:
+        shutil.rmtree(tmpdir)
+
 def test_no_dangling_files():
     
     gc.collect()
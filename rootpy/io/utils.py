@@ -10,6 +10,7 @@ import itertools
 import os
 from .. import asrootpy
 from . import DoesNotExist
+from . import index
 
 
 def walk(tdirectory, top=None, path=None, depth=0, maxdepth=-1,
@@ -32,11 +33,31 @@ def walk(tdirectory, top=None, path=None, depth=0, maxdepth=-1,
 
     If treat_dirs_as_objs is True, filenames contains directories as well.
 
+    If key indexes are enabled (see :mod:`rootpy.io.index`), the directories
+    of files opened read-only are listed from the index of the file.
+
     """
 
-    dirnames, objectnames = [], []
     if top:
         tdirectory = tdirectory.GetDirectory(top)
+    if path:
+        dirpath = os.path.join(path, tdirectory.GetName())
+    elif not isinstance(tdirectory, ROOT.TFile):
+        dirpath = tdirectory.GetName()
+    else:
+        dirpath = ''
+    keyindex, indexpath = index.lookup(tdirectory)
+    if keyindex is not None:
+        # list the directories from the key index instead of reading them
+        for x in keyindex.walk(indexpath, dirpath,
+                               depth=depth,
+                               maxdepth=maxdepth,
+                               class_pattern=class_pattern,
+                               return_classname=return_classname,
+                               treat_dirs_as_objs=treat_dirs_as_objs):
+            yield x
+        return
+    dirnames, objectnames = [], []
     for key in tdirectory.unique_keys():
         name = key.GetName()
         classname = key.GetClassName()
@@ -49,12 +70,6 @@ def walk(tdirectory, top=None, path=None, depth=0, maxdepth=-1,
                     continue
             name = (name if not return_classname else (name, classname))
             objectnames.append(name)
-    if path:
-        dirpath = os.path.join(path, tdirectory.GetName())
-    elif not isinstance(tdirectory, ROOT.TFile):
-        dirpath = tdirectory.GetName()
-    else:
-        dirpath = ''
     yield dirpath, dirnames, objectnames
     if depth == maxdepth:
         return
@@ -290,6 +290,61 @@ class _HistBase(Plottable, NamedObject):
             return self._edgesh(axis, -1)
         return self._edgesl(axis, index)
 
+    def _binning_key(self, axis):
+
+        import numpy as np
+        ax = self.axis(axis)
+        xbins = ax.GetXbins()
+        nxbins = xbins.GetSize()
+        if nxbins:
+            # the values of variable-width edges may change without a change
+            # of the number of bins or of the range (i.e. with TAxis.Set)
+            buf = xbins.GetArray()
+            buf.SetSize(nxbins)
+            xbins = np.frombuffer(buf, dtype='f8', count=nxbins).tostring()
+        else:
+            xbins = None
+        return ax.GetNbins(), ax.GetXmin(), ax.GetXmax(), xbins
+
+    def edges_array(self, axis=1):
+        """
+        Return a read-only NumPy array of the bin edges along an axis,
+        excluding the underflow and overflow bins. The array is cached until
+        the binning of the axis changes.
+        """
+        key = self._binning_key(axis)
+        cache = self.__dict__.setdefault('_edges_cache', {})
+        try:
+            cached_key, edges = cache[axis]
+            if cached_key == key:
+                return edges
+        except KeyError:
+            pass
+        import numpy as np
+        nbins, low, high, xbins = key
+        if xbins is not None:
+            # variable-width bins
+            edges = np.frombuffer(xbins, dtype='f8').copy()
+        else:
+            edges = np.linspace(low, high, nbins + 1)
+        edges.flags.writeable = False
+        cache[axis] = (key, edges)
+        return edges
+
+    def centers_array(self, axis=1):
+        """
+        Return a NumPy array of the bin centers along an axis
+        """
+        edges = self.edges_array(axis)
+        return (edges[:-1] + edges[1:]) / 2
+
+    def widths_array(self, axis=1):
+        """
+        Return a NumPy array of the bin widths along an axis
+        """
+        import numpy as np
+        return np.diff(self.edges_array(axis))
+
     def _width(self, axis, index=None):
 
         if index is None:
@@ -439,17 +494,161 @@ class _HistBase(Plottable, NamedObject):
 
         return array(typecode, self._content())
 
+    def _view(self, buf, dtype):
+
+        import numpy as np
+        size = self.GetSize()
+        buf.SetSize(size)
+        # ROOT stores bins with the x index varying fastest
+        shape = tuple(reversed([self.nbins(axis) + 2
+                                for axis in xrange(1, self.GetDimension() + 1)]))
+        return np.frombuffer(buf, dtype=dtype, count=size).reshape(shape).T
+
+    def contents_view(self):
+        """
+        Return a NumPy array sharing memory with the bin contents of this
+        histogram, including the underflow and overflow bins, with one
+        dimension per axis. The content of bin (i, j, k) in ROOT's
+        convention is ``view[i, j, k]`` so ``view[1:-1, 1:-1, 1:-1]`` excludes
+        the underflow and overflow bins. Modifying the array modifies the
+        histogram in place. The array must not be used after the histogram
+        is deleted or rebinned.
+        """
+        for arraytype, dtype in ((ROOT.TArrayD, 'f8'),
+                                 (ROOT.TArrayF, 'f4'),
+                                 (ROOT.TArrayI, 'i4'),
+                                 (ROOT.TArrayS, 'i2')):
+            if isinstance(self, arraytype):
+                return self._view(self.GetArray(), dtype)
+        raise TypeError(
+            "contents_view is not supported for %s" % self.__class__.__name__)
+
+    def errors_view(self):
+        """
+        Return a NumPy array sharing memory with the sum of squares of weights
+        of each bin (the squared bin errors), with the same layout as
+        ``contents_view``. The sum of squares of weights is created if it
+        does not exist yet.
+        """
+        sumw2 = self.GetSumw2()
+        if sumw2.GetSize() == 0:
+            self.Sumw2()
+        return self._view(sumw2.GetArray(), 'f8')
+
+    def _find_bins(self, values, axis):
+
+        import numpy as np
+        ax = self.axis(axis)
+        nbins = ax.GetNbins()
+        if ax.GetXbins().GetSize():
+            # variable-width bins (NaN is sorted into the overflow)
+            return np.searchsorted(self.edges_array(axis), values,
+                                   side='right')
+        # uniform bins: same arithmetic as TAxis::FindBin
+        low, high = ax.GetXmin(), ax.GetXmax()
+        bins = np.empty(len(values), dtype=np.intp)
+        bins.fill(nbins + 1)
+        bins[values < low] = 0
+        inrange = (values >= low) & (values < high)
+        bins[inrange] = 1 + (
+            nbins * (values[inrange] - low) / (high - low)).astype(np.intp)
+        return bins
+
     def fill_array(self, array, weights=None):
         """
         Fill this histogram with a NumPy array
+
+        Entries are binned with NumPy (arithmetic for uniform bins and
+        ``searchsorted`` for variable-width bins), accumulated with
+        ``bincount`` and added to the bin contents, the sum of squares of
+        weights and the statistics in one step.
+
+        Parameters
+        ----------
+        array : array-like
+            The values to fill. For multidimensional histograms the array
+            must have the shape (N, D) where D is the dimension of the
+            histogram.
+
+        weights : array-like, optional (default=None)
+            The weight of each entry
         """
+        import numpy as np
+        ndim = self.GetDimension()
+        array = np.asarray(array, dtype=np.float64)
+        if ndim == 1:
+            array = array.reshape(-1, 1)
+        if array.ndim != 2 or array.shape[1] != ndim:
+            raise ValueError(
+                "array must have the shape (N, %d) to fill a %dD histogram" %
+                (ndim, ndim))
+        if weights is not None:
+            weights = np.asarray(weights, dtype=np.float64).ravel()
+            if len(weights) != len(array):
+                raise ValueError(
+                    "array and weights must have the same length")
+        size = self.GetSize()
+        # get the statistics before modifying the contents since ROOT may
+        # compute them from the contents
+        entries = self.GetEntries()
+        stats = np.zeros(13, dtype=np.float64)
+        self.GetStats(stats)
+
+        gbins = np.zeros(len(array), dtype=np.intp)
+        inrange = np.ones(len(array), dtype=bool)
+        stride = 1
+        for axis in xrange(1, ndim + 1):
+            bins = self._find_bins(array[:, axis - 1], axis)
+            nbins = self.nbins(axis)
+            inrange &= (bins >= 1) & (bins <= nbins)
+            gbins += bins * stride
+            stride *= nbins + 2
+
+        sumw = np.bincount(gbins, weights=weights, minlength=size)
+        if weights is not None or self.GetSumw2N():
+            if weights is not None and not self.GetSumw2N():
+                # ROOT creates the sum of squares of weights on the first
+                # weighted fill
+                self.Sumw2()
+            if weights is None:
+                sumw2 = sumw
+            else:
+                sumw2 = np.bincount(gbins, weights=weights ** 2,
+                                    minlength=size)
+            self.errors_view().ravel('F')[:] += sumw2
         try:
-            from root_numpy import fill_array
-        except ImportError:
-            log.critical("root_numpy is needed for Hist*.fill_array. Is it "
-                         "installed and importable?")
-            raise
-        fill_array(self, array, weights=weights)
+            contents = self.contents_view().ravel('F')
+        except TypeError:
+            # no view on the contents of TH*C, set the filled bins only
+            for gbin in np.flatnonzero(sumw):
+                self.SetBinContent(int(gbin),
+                                   self.GetBinContent(int(gbin)) + sumw[gbin])
+        else:
+            contents[:] += sumw.astype(contents.dtype)
+
+        # update the statistics with entries inside the axes ranges
+        values = array[inrange]
+        if weights is None:
+            w = np.ones(len(values))
+        else:
+            w = weights[inrange]
+        stats[0] += w.sum()
+        stats[1] += (w ** 2).sum()
+        # the order of the statistics is defined by TH1/TH2/TH3::GetStats:
+        # wx, wx2, wy, wy2, wxy, wz, wz2, wxz, wyz
+        stats[2] += (w * values[:, 0]).sum()
+        stats[3] += (w * values[:, 0] ** 2).sum()
+        if ndim > 1:
+            stats[4] += (w * values[:, 1]).sum()
+            stats[5] += (w * values[:, 1] ** 2).sum()
+            stats[6] += (w * values[:, 0] * values[:, 1]).sum()
+        if ndim > 2:
+            stats[7] += (w * values[:, 2]).sum()
+            stats[8] += (w * values[:, 2] ** 2).sum()
+            stats[9] += (w * values[:, 0] * values[:, 2]).sum()
+            stats[10] += (w * values[:, 1] * values[:, 2]).sum()
+        self.PutStats(stats)
+        self.SetEntries(entries + len(array))
 
     def quantiles(self, quantiles):
         qs = array('d', quantiles)
@@ -1430,7 +1629,12 @@ def FillHistogram(data, *args, **kwargs):
         del kwargs['binning']
         
     histo = Hist(*args, **kwargs)
-    for d in data:
-        histo.Fill(d)
+    try:
+        import numpy
+    except ImportError:
+        for d in data:
+            histo.Fill(d)
+    else:
+        histo.fill_array(numpy.asarray(data))
     return list(histo.xedgesl()), histo
 
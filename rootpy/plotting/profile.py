@@ -6,7 +6,13 @@ from .hist import _Hist, _Hist2D, _Hist3D
 
 
 class _ProfileBase(object):
-    pass
+
+    def fill_array(self, array, weights=None):
+        """
+        Not supported for profiles since the entries and sums of each bin
+        would not be updated
+        """
+        raise TypeError("profiles cannot be filled with an array")
 
 
 class Profile(_ProfileBase, _Hist, QROOT.TProfile):
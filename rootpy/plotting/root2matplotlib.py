@@ -209,7 +209,8 @@ def _hist(h, axes=None, **kwargs):
     _set_defaults(h, kwargs, ['common', 'line', 'fill'])
     if 'histtype' not in kwargs:
         kwargs['histtype'] = h.GetFillStyle('root') and 'stepfilled' or 'step'
-    return axes.hist(list(h.x()), weights=list(h.y()), bins=list(h.xedges()), **kwargs)
+    return axes.hist(h.centers_array(), weights=list(h.y()),
+                     bins=h.edges_array(), **kwargs)
 
 
 def bar(hists, stacked=True, reverse=False,
@@ -340,8 +341,9 @@ def _bar(h, roffset=0., rwidth=1., xerr=None, yerr=None, axes=None, **kwargs):
     if yerr:
         yerr = np.array([list(h.yerrl()), list(h.yerrh())])
     _set_defaults(h, kwargs, ['common', 'line', 'fill', 'errors'])
-    width = [x * rwidth for x in h.xwidth()]
-    left = [h.xedgesl(i) + h.xwidth(i) * roffset for i in range(len(h))]
+    widths = h.widths_array()
+    width = widths * rwidth
+    left = h.edges_array()[:-1] + widths * roffset
     height = list(h)
     return axes.bar(left, height, width=width, xerr=xerr, yerr=yerr, **kwargs)
 
@@ -426,7 +428,7 @@ def step(h, axes=None, **kwargs):
     _set_defaults(h, kwargs, ['common', 'line'])
     if 'color' not in kwargs:
         kwargs['color'] = h.GetLineColor('mpl')
-    return axes.step(list(h.xedges()), list(h) + [0.], where='post', **kwargs)
+    return axes.step(h.edges_array(), list(h) + [0.], where='post', **kwargs)
 
 
 def fill_between(a, b, axes=None, logy=None, **kwargs):
@@ -475,12 +477,12 @@ def hist2d(h, axes=None, **kwargs):
     """
     if axes is None:
         axes = plt.gca()
-    X, Y = np.meshgrid(list(h.x()), list(h.y()))
+    X, Y = np.meshgrid(h.centers_array(1), h.centers_array(2))
     x = X.ravel()
     y = Y.ravel()
     z = np.array(h.z()).T
     return axes.hist2d(x, y, weights=z.ravel(),
-                       bins=(list(h.xedges()), list(h.yedges())),
+                       bins=(h.edges_array(1), h.edges_array(2)),
                        **kwargs)
 
 
@@ -1,7 +1,9 @@
 # Copyright 2012 the rootpy developers
 # distributed under the terms of the GNU General Public License
-from rootpy.plotting import Hist, Hist2D, Hist3D, HistStack
-from nose.tools import raises, assert_equals, assert_raises
+from rootpy.plotting import Hist, Hist2D, Hist3D, HistStack, Profile
+from nose.tools import (raises, assert_equals, assert_raises,
+                        assert_almost_equal)
+from nose.plugins.skip import SkipTest
 
 
 def test_init():
@@ -71,6 +73,99 @@ def test_indexing():
     assert_raises(IndexError, hist.__getitem__, -1)
     assert_raises(IndexError, hist.__getitem__, 10)
 
+def test_contents_view():
+
+    try:
+        import numpy
+    except ImportError:
+        raise SkipTest("numpy is not installed")
+
+    hist = Hist3D(3, 0, 3, 4, 0, 4, 5, 0, 5, type='D')
+    hist.Fill(1.5, 2.5, 3.5, 2.)
+    view = hist.contents_view()
+    assert_equals(view.shape, (5, 6, 7))
+    assert_equals(view[2, 3, 4], 2.)
+    assert_equals(view.sum(), 2.)
+    # the view shares memory with the histogram
+    view[1, 1, 1] = 5.
+    assert_equals(hist.GetBinContent(1, 1, 1), 5.)
+    view *= 2
+    assert_equals(hist.GetBinContent(2, 3, 4), 4.)
+
+    errors = hist.errors_view()
+    assert_equals(errors.shape, (5, 6, 7))
+    assert_equals(errors[2, 3, 4], 4.)
+
+    hist = Hist(10, 0, 1)
+    hist.Fill(-1)
+    view = hist.contents_view()
+    assert_equals(view.dtype, numpy.float32)
+    assert_equals(list(view[[0, -1]]), [1, 0])
+
+
+def test_edges_array():
+
+    try:
+        __import__('numpy')
+    except ImportError:
+        raise SkipTest("numpy is not installed")
+
+    hist = Hist2D([1, 4, 10, 100], 4, 0, 1)
+    assert_equals(list(hist.edges_array(1)), [1, 4, 10, 100])
+    assert_equals(list(hist.edges_array(2)), list(hist.yedges()))
+    assert_equals(list(hist.centers_array(1)), list(hist.x()))
+    assert_equals(list(hist.widths_array(1)), list(hist.xwidth()))
+    assert_equals(hist.edges_array(2) is hist.edges_array(2), True)
+    # the cache is invalidated when the binning changes
+    hist.GetYaxis().Set(2, 0, 10)
+    assert_equals(list(hist.edges_array(2)), [0, 5, 10])
+    # new variable-width edges with the same number of bins and range
+    from array import array
+    hist.GetXaxis().Set(3, array('d', [1, 2, 50, 100]))
+    assert_equals(list(hist.edges_array(1)), [1, 2, 50, 100])
+    assert_equals(list(hist.centers_array(1)), [1.5, 26, 75])
+
+
+def test_fill_array():
+
+    try:
+        import numpy as np
+    except ImportError:
+        raise SkipTest("numpy is not installed")
+
+    values = np.random.normal(0, 2, size=(1000, 3))
+    values[0] = [np.nan, -100, 100]
+    weights = np.random.uniform(0, 1, size=1000)
+    for hist in (Hist(10, -3, 3, type='D'),
+                 Hist2D([-3, -1, 0, 0.5, 3], 5, -3, 3, type='D'),
+                 Hist3D(5, -3, 3, 4, -2, 2, 3, -1, 1, type='D')):
+        ndim = hist.GetDimension()
+        for w in (None, weights):
+            expected = hist.Clone()
+            hist.fill_array(values[:, :ndim], w)
+            for i, row in enumerate(values[:, :ndim]):
+                if w is None:
+                    expected.Fill(*row)
+                else:
+                    expected.Fill(*(list(row) + [w[i]]))
+            assert_equals(hist.GetEntries(), expected.GetEntries())
+            for gbin in xrange(hist.GetSize()):
+                assert_almost_equal(hist.GetBinContent(gbin),
+                                    expected.GetBinContent(gbin))
+                assert_almost_equal(hist.GetBinError(gbin),
+                                    expected.GetBinError(gbin))
+            for axis in xrange(1, ndim + 1):
+                assert_almost_equal(hist.GetMean(axis),
+                                    expected.GetMean(axis))
+                assert_almost_equal(hist.GetRMS(axis), expected.GetRMS(axis))
+            for axis1, axis2 in ((1, 2), (1, 3), (2, 3)):
+                if axis2 <= ndim:
+                    assert_almost_equal(
+                        hist.GetCovariance(axis1, axis2),
+                        expected.GetCovariance(axis1, axis2))
+    # the entries and sums of each bin of profiles are not filled
+    assert_raises(TypeError, Profile(10, -3, 3).fill_array, values[:, :1])
+
 
 if __name__ == "__main__":
     import nose
@@ -0,0 +1,75 @@
+# Copyright 2012 the rootpy developers
+# distributed under the terms of the GNU General Public License
+from rootpy.plotting import Hist
+from rootpy.plotting.views import CachedView, ScaleView
+from rootpy.io import root_open, FilePool, PooledDirectory
+from nose.tools import assert_equals
+
+import gc
+import os
+import shutil
+import tempfile
+
+
+def _write(filename, weight):
+
+    with root_open(filename, 'recreate'):
+        for name in ('a', 'b', 'c'):
+            h = Hist(1, 0, 1, name=name)
+            h.Fill(.5, weight)
+            h.Write()
+
+
+def test_cached_view():
+
+    tmpdir = tempfile.mkdtemp()
+    try:
+        filename = os.path.join(tmpdir, 'input.root')
+        _write(filename, 1)
+        pool = FilePool()
+        view = CachedView(ScaleView(PooledDirectory(filename, pool=pool), 2),
+                          max_entries=2, check_interval=0)
+
+        # hits return clones of the remembered objects
+        first = view.Get('a')
+        second = view.Get('a')
+        assert_equals((view.hits, view.misses), (1, 1))
+        assert_equals(first is second, False)
+        assert_equals(second.Integral(), 2)
+
+        # the least recently used object is forgotten
+        view.Get('b')
+        view.Get('a')
+        view.Get('c')
+        assert_equals((view.hits, view.misses), (2, 3))
+        view.Get('b')
+        assert_equals((view.hits, view.misses), (2, 4))
+
+        # objects are forgotten when the file changes
+        del first, second
+        gc.collect()
+        _write(filename, 5)
+        stat = os.stat(filename)
+        os.utime(filename, (stat.st_atime, stat.st_mtime + 10))
+        assert_equals(view.Get('a').Integral(), 10)
+        assert_equals((view.hits, view.misses), (2, 5))
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+def test_cached_view_check_interval():
+
+    tmpdir = tempfile.mkdtemp()
+    try:
+        filename = os.path.join(tmpdir, 'input.root')
+        _write(filename, 1)
+        view = CachedView(PooledDirectory(filename, pool=FilePool()),
+                          check_interval=3600)
+        view.Get('a')
+        stat = os.stat(filename)
+        os.utime(filename, (stat.st_atime, stat.st_mtime + 10))
+        # the files are not checked again within the interval
+        view.Get('a')
+        assert_equals((view.hits, view.misses), (1, 1))
+    finally:
+        shutil.rmtree(tmpdir)
@@ -21,6 +21,7 @@ Summary of views:
 - FunctorView: apply a arbitrary transformation function to the histograms
 - MultiFunctorView: apply a arbitrary transformation function to a collection of histograms
 - SubdirectoryView: A view of a subdirectory, which maintains the same view as the base.
+- CachedView: remember the results of another view for repeated queries
 
 Example use case
 ================
@@ -247,13 +248,39 @@ True
 >>> equivalent(histo1, histo2)
 False
 
+CachedView
+----------
+
+Composite views read and transform the objects of all underlying folders on
+each query.  A CachedView remembers the results of a view and returns clones
+of them when the same path is queried again.
+
+>>> cached = CachedView(subdir1view)
+>>> equivalent(cached.Get('mutau_mass'), histo1)
+True
+>>> equivalent(cached.Get('mutau_mass'), histo1)
+True
+>>> cached.hits, cached.misses
+(1, 1)
+
 '''
 
 import os
+import copy
+import time
+from collections import OrderedDict
 import ROOT
 from .core import Plottable
 from .hist import HistStack
-from ..io import Directory, DoesNotExist
+from ..io import Directory, DoesNotExist, PooledDirectory
+from ..context import preserve_set_th1_add_directory
+
+
+def _directory(directory):
+    ''' Open file paths (e.g. "sample.root:/dir") through the file pool '''
+    if isinstance(directory, basestring):
+        return PooledDirectory(directory)
+    return directory
 
 
 class _FolderView(object):
@@ -272,8 +299,12 @@ class _FolderView(object):
     '''
 
     def __init__(self, directory):
-        ''' Initialize with the directory to be wrapped '''
-        self.dir = directory
+        '''
+        Initialize with the directory to be wrapped. The directory may be
+        given as a path "file.root[:/dir]" opened through the file pool of
+        :mod:`rootpy.io.pool`.
+        '''
+        self.dir = _directory(directory)
 
     def path(self):
         ''' Get the path of the wrapped folder '''
@@ -315,7 +346,7 @@ class _MultiFolderView(object):
     variable.
     '''
     def __init__(self, *directories):
-        self.dirs = directories
+        self.dirs = [_directory(directory) for directory in directories]
 
     def __str__(self):
         return "%s(%s)" % (self.__class__.__name__,
@@ -502,6 +533,95 @@ class SubdirectoryView(PathModifierView):
         super(SubdirectoryView, self).__init__(dir, functor)
 
 
+def _files(directory):
+    ''' List the local files read through a FilePool by a directory or view '''
+    if isinstance(directory, _FolderView):
+        return _files(directory.dir)
+    if isinstance(directory, _MultiFolderView):
+        files = []
+        for subdir in directory.dirs:
+            files += _files(subdir)
+        return files
+    if (isinstance(directory, PooledDirectory) and
+            '://' not in directory.filename):
+        return [directory.filename]
+    return []
+
+
+def _copy(obj):
+    ''' Copy an object without attaching it to the current directory '''
+    if isinstance(obj, ROOT.TObject):
+        with preserve_set_th1_add_directory(False):
+            return obj.Clone(obj.GetName())
+    return copy.copy(obj)
+
+
+class CachedView(_FolderView):
+    '''
+    View of a folder (or of another view) which remembers the objects it
+    returns.  Querying a path again returns a clone of the remembered object
+    instead of reading and transforming it again.
+
+    At most <max_entries> objects are remembered (the least recently used
+    are forgotten first).  All objects are forgotten when a file read through
+    a PooledDirectory changes on disk, since the pool then reopens the file.
+    The files are checked at most once every <check_interval> seconds.
+    Folders which are open TDirectory objects keep reading the file as it was
+    opened, so changes to their files are ignored.
+    '''
+    def __init__(self, directory, max_entries=1000, check_interval=1.):
+        super(CachedView, self).__init__(directory)
+        self.max_entries = max_entries
+        self.check_interval = check_interval
+        self.hits = 0
+        self.misses = 0
+        self._files = sorted(set(_files(self.dir)))
+        self._fingerprint = self.fingerprint()
+        self._checked = time.time()
+        self._cache = OrderedDict()
+
+    def fingerprint(self):
+        ''' The sizes and modification times of the pooled files of the view '''
+        fingerprint = []
+        for filename in self._files:
+            try:
+                stat = os.stat(filename)
+            except OSError:
+                fingerprint.append(None)
+            else:
+                fingerprint.append((stat.st_size, stat.st_mtime))
+        return fingerprint
+
+    def clear(self):
+        ''' Forget all objects '''
+        self._cache.clear()
+
+    def Get(self, path):
+        ''' Get a clone of the (modified) object from path '''
+        now = time.time()
+        if self._files and now - self._checked >= self.check_interval:
+            self._checked = now
+            fingerprint = self.fingerprint()
+            if fingerprint != self._fingerprint:
+                self.clear()
+                self._fingerprint = fingerprint
+        if path in self._cache:
+            self.hits += 1
+            obj = self._cache.pop(path)
+            self._cache[path] = obj
+            return _copy(obj)
+        self.misses += 1
+        obj = self.dir.Get(path)
+        self._cache[path] = _copy(obj)
+        while len(self._cache) > self.max_entries:
+            self._cache.popitem(last=False)
+        return obj
+
+    def apply_view(self, obj):
+        ''' Do nothing '''
+        return obj
+
+
 if __name__ == "__main__":
     import doctest
     doctest.testmod()
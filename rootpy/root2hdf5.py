@@ -8,8 +8,11 @@ from __future__ import absolute_import
 
 import os
 import sys
+import multiprocessing
 import tables
 import warnings
+from itertools import izip
+from collections import deque
 
 from .io import root_open, utils, TemporaryFile
 from . import log; log = log[__name__]
@@ -33,131 +36,173 @@ def _drop_object_col(rec, warn=True):
     return rec
 
 
-def convert(rfile, hfile, rpath='', entries=-1, userfunc=None, selection=None):
+def _read_chunk(tree, offset, entries, selection, warn=True):
 
+    if warn:
+        recarray = tree2rec(tree,
+                entries=entries,
+                offset=offset,
+                selection=selection)
+    else:
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore",
+                    RootNumpyUnconvertibleWarning)
+            recarray = tree2rec(tree,
+                    entries=entries,
+                    offset=offset,
+                    selection=selection)
+    return _drop_object_col(recarray, warn=warn)
+
+
+# files opened by each worker process, reused across chunks
+_WORKER_FILES = {}
+
+
+def _read_chunk_worker(args):
+
+    filename, treepath, offset, entries, selection = args
+    try:
+        rfile = _WORKER_FILES[filename]
+    except KeyError:
+        rfile = root_open(filename)
+        _WORKER_FILES[filename] = rfile
+    tree = rfile.Get(treepath)
+    try:
+        return _read_chunk(tree, offset, entries, selection, warn=False)
+    finally:
+        tree.Delete()
+
+
+def _get_group(hfile, where_group, current_dir):
+
+    path = os.path.join(where_group, current_dir)
+    try:
+        return hfile.getNode(path)
+    except tables.NoSuchNodeError:
+        return hfile.createGroup(where_group, current_dir, "")
+
+
+def convert(rfile, hfile, rpath='', entries=-1, userfunc=None, selection=None,
+            processes=1, resume=False):
+    """
+    Convert all trees in a ROOT file into tables in an HDF5 file
+
+    Parameters
+    ----------
+    rfile : str or rootpy.io.File
+        The input ROOT file
+
+    hfile : str or tables.File
+        The output HDF5 file
+
+    rpath : str, optional (default='')
+        Only convert trees below this path in the ROOT file
+
+    entries : int, optional (default=-1)
+        The number of entries to read at once. Read whole trees at once
+        if not positive.
+
+    userfunc : callable, optional (default=None)
+        A function called on each tree that returns the tree or list of
+        trees that will be converted instead of the original tree.
+
+    selection : str, optional (default=None)
+        Only convert entries passing this selection
+
+    processes : int, optional (default=1)
+        The number of processes reading chunks of ``entries`` entries in
+        parallel. Chunks are written in order by this process. Only trees
+        read in chunks and not passed through ``userfunc`` are read in
+        parallel.
+
+    resume : bool, optional (default=False)
+        Resume an interrupted conversion. The number of entries converted is
+        recorded on each table after each chunk is written, so conversion
+        continues from the last completed chunk. ``hfile`` must then be
+        opened in append mode.
+    """
     isatty = check_tty(sys.stdout)
     if isatty:
         widgets = [Percentage(), ' ', Bar(), ' ', ETA()]
 
     own_h5file = False
     if isinstance(hfile, basestring):
-        hfile = tables.openFile(filename=hfile, mode="w", title="Data")
+        hfile = tables.openFile(filename=hfile,
+                                mode="a" if resume else "w",
+                                title="Data")
         own_h5file = True
     own_rootfile = False
     if isinstance(rfile, basestring):
         rfile = root_open(rfile)
         own_rootfile = True
 
-    for dirpath, dirnames, treenames in utils.walk(
-            rfile, rpath, class_pattern='TTree'):
+    pool = None
+    if processes > 1 and entries > 0:
+        pool = multiprocessing.Pool(processes)
 
-        # skip root
-        if not dirpath and not treenames:
-            continue
+    try:
+        for dirpath, dirnames, treenames in utils.walk(
+                rfile, rpath, class_pattern='TTree'):
 
-        # skip directories w/o trees or subdirs
-        if not dirnames and not treenames:
-            continue
+            # skip root
+            if not dirpath and not treenames:
+                continue
 
-        where_group = '/' + os.path.dirname(dirpath)
-        current_dir = os.path.basename(dirpath)
+            # skip directories w/o trees or subdirs
+            if not dirnames and not treenames:
+                continue
 
-        if not current_dir:
-            group = hfile.root
-        else:
-            group = hfile.createGroup(where_group, current_dir, "")
+            where_group = '/' + os.path.dirname(dirpath)
+            current_dir = os.path.basename(dirpath)
 
-        ntrees = len(treenames)
-        if ntrees > 1:
-            log.info("Will convert %i trees in this directory" % ntrees)
-        else:
-            log.info("Will convert 1 tree in this directory")
+            if not current_dir:
+                group = hfile.root
+            elif resume:
+                group = _get_group(hfile, where_group, current_dir)
+            else:
+                group = hfile.createGroup(where_group, current_dir, "")
 
-        for treename in treenames:
+            ntrees = len(treenames)
+            if ntrees > 1:
+                log.info("Will convert %i trees in this directory" % ntrees)
+            else:
+                log.info("Will convert 1 tree in this directory")
 
-            input_tree = rfile.Get(os.path.join(dirpath, treename))
+            for treename in treenames:
 
-            if userfunc is not None:
-                tmp_file = TemporaryFile()
-                # call user-defined function on tree and get output trees
-                log.info("Calling user function on tree '%s'" %
-                    input_tree.GetName())
-                trees = userfunc(input_tree)
+                treepath = os.path.join(dirpath, treename)
+                input_tree = rfile.Get(treepath)
 
-                if not isinstance(trees, list):
-                    trees = [trees]
+                if userfunc is not None:
+                    tmp_file = TemporaryFile()
+                    # call user-defined function on tree and get output trees
+                    log.info("Calling user function on tree '%s'" %
+                        input_tree.GetName())
+                    trees = userfunc(input_tree)
+
+                    if not isinstance(trees, list):
+                        trees = [trees]
 
-            else:
-                trees = [input_tree]
-                tmp_file = None
-
-            for tree in trees:
-
-                log.info("Converting tree '%s' with %i entries ..." % (
-                    tree.GetName(),
-                    tree.GetEntries()))
-
-                total_entries = tree.GetEntries()
-                pbar = None
-                if isatty and total_entries > 0:
-                    pbar = ProgressBar(widgets=widgets, maxval=total_entries)
-
-                if entries <= 0:
-                    # read the entire tree
-                    if pbar is not None:
-                        pbar.start()
-                    recarray = tree2rec(tree, selection=selection)
-                    recarray = _drop_object_col(recarray)
-                    table = hfile.createTable(
-                        group, tree.GetName(),
-                        recarray, tree.GetTitle())
-                    # flush data in the table
-                    table.flush()
-                    # flush all pending data
-                    hfile.flush()
                 else:
-                    # read the tree in chunks
-                    offset = 0
-                    while offset < total_entries or offset == 0:
-                        if offset > 0:
-                            with warnings.catch_warnings():
-                                warnings.simplefilter("ignore",
-                                        RootNumpyUnconvertibleWarning)
-                                recarray = tree2rec(tree,
-                                        entries=entries,
-                                        offset=offset,
-                                        selection=selection)
-                            recarray = _drop_object_col(recarray, warn=False)
-                            table.append(recarray)
-                        else:
-                            recarray = tree2rec(tree,
-                                    entries=entries,
-                                    offset=offset,
-                                    selection=selection)
-                            recarray = _drop_object_col(recarray)
-                            if pbar is not None:
-                                # start after any output from root_numpy
-                                pbar.start()
-                            table = hfile.createTable(
-                                group, tree.GetName(),
-                                recarray, tree.GetTitle())
-                        offset += entries
-                        if offset <= total_entries and pbar is not None:
-                            pbar.update(offset)
-                        # flush data in the table
-                        table.flush()
-                        # flush all pending data
-                        hfile.flush()
-
-                if pbar is not None:
-                    pbar.finish()
-
-            input_tree.Delete()
-
-            if userfunc is not None:
+                    trees = [input_tree]
+                    tmp_file = None
+
                 for tree in trees:
-                    tree.Delete()
-                tmp_file.Close()
+                    _convert_tree(rfile, hfile, group, tree,
+                                  treepath if userfunc is None else None,
+                                  entries, selection, pool, processes,
+                                  resume, widgets if isatty else None)
+
+                input_tree.Delete()
+
+                if userfunc is not None:
+                    for tree in trees:
+                        tree.Delete()
+                    tmp_file.Close()
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
 
     if own_h5file:
         hfile.close()
@@ -165,6 +210,116 @@ def convert(rfile, hfile, rpath='', entries=-1, userfunc=None, selection=None):
         rfile.Close()
 
 
+def _imap_bounded(pool, func, tasks, window):
+    """
+    Like ``pool.imap`` but with at most ``window`` results computed ahead of
+    the consumer so that the results do not pile up in memory
+    """
+    pending = deque()
+    for task in tasks:
+        if len(pending) >= window:
+            yield pending.popleft().get()
+        pending.append(pool.apply_async(func, (task,)))
+    while pending:
+        yield pending.popleft().get()
+
+
+def _convert_tree(rfile, hfile, group, tree, treepath,
+                  entries, selection, pool, processes, resume, widgets):
+
+    total_entries = tree.GetEntries()
+    table = None
+    offset = 0
+    if resume and tree.GetName() in group:
+        table = getattr(group, tree.GetName())
+        attrs = table.attrs
+        if 'entries_converted' not in attrs:
+            # interrupted before the first chunk was recorded
+            log.warning("restarting the conversion of tree '%s'" %
+                tree.GetName())
+            table._f_remove()
+            table = None
+    if table is not None:
+        attrs = table.attrs
+        offset = attrs.entries_converted
+        # discard rows written after the last completed chunk
+        table.truncate(attrs.rows_converted)
+        if offset >= total_entries:
+            log.info("Tree '%s' is already converted" % tree.GetName())
+            return
+        log.info("Resuming conversion of tree '%s' at entry %i" % (
+            tree.GetName(), offset))
+    else:
+        log.info("Converting tree '%s' with %i entries ..." % (
+            tree.GetName(), total_entries))
+
+    pbar = None
+    if widgets is not None and total_entries > 0:
+        pbar = ProgressBar(widgets=widgets, maxval=total_entries)
+
+    if entries <= 0:
+        # read the entire tree
+        if pbar is not None:
+            pbar.start()
+        recarray = tree2rec(tree, selection=selection)
+        recarray = _drop_object_col(recarray)
+        table = hfile.createTable(
+            group, tree.GetName(),
+            recarray, tree.GetTitle())
+        # flush data in the table
+        table.flush()
+        table.attrs.entries_converted = total_entries
+        table.attrs.rows_converted = table.nrows
+        # flush all pending data
+        hfile.flush()
+    else:
+        # read the tree in chunks
+        entries = int(entries)
+        offsets = range(offset, total_entries, entries) or [0]
+        if pool is not None and treepath is not None:
+            # read ahead by at most two chunks per process
+            chunks = _imap_bounded(pool, _read_chunk_worker,
+                [(rfile.GetName(), treepath, chunk_offset, entries, selection)
+                 for chunk_offset in offsets], 2 * processes)
+        else:
+            chunks = (_read_chunk(tree, chunk_offset, entries, selection,
+                                  warn=chunk_offset == 0)
+                      for chunk_offset in offsets)
+        if pbar is not None:
+            pbar.start()
+        for chunk_offset, recarray in izip(offsets, chunks):
+            if table is None:
+                table = hfile.createTable(
+                    group, tree.GetName(),
+                    recarray, tree.GetTitle())
+            else:
+                table.append(recarray)
+            # flush data in the table
+            table.flush()
+            # record the completed chunk
+            table.attrs.entries_converted = min(
+                chunk_offset + entries, total_entries)
+            table.attrs.rows_converted = table.nrows
+            # flush all pending data
+            hfile.flush()
+            if pbar is not None:
+                pbar.update(min(chunk_offset + entries, total_entries))
+
+    if pbar is not None:
+        pbar.finish()
+
+
+def _resumable(hfile):
+    """
+    Return True if a conversion into this file can be resumed, i.e. at least
+    one chunk of a tree was recorded as converted
+    """
+    for table in hfile.walkNodes('/', 'Table'):
+        if 'entries_converted' in table.attrs:
+            return True
+    return False
+
+
 def main():
 
     from rootpy.extern.argparse import (ArgumentParser,
@@ -196,6 +351,11 @@ def main():
                  "original tree")
     parser.add_argument('-q', '--quiet', action='store_true', default=False,
             help="suppress all warnings")
+    parser.add_argument('-p', '--processes', type=int, default=1,
+            help="number of processes reading chunks of entries in parallel")
+    parser.add_argument('--resume', action='store_true', default=False,
+            help="resume an interrupted conversion into existing output \n"
+                 "files")
     parser.add_argument('files', nargs='+')
     args = parser.parse_args()
 
@@ -232,7 +392,7 @@ def main():
 
     for inputname in args.files:
         outputname = os.path.splitext(inputname)[0] + '.' + args.ext
-        if os.path.exists(outputname) and not args.force:
+        if os.path.exists(outputname) and not (args.force or args.resume):
             sys.exit(('Output %s already exists. '
                 'Use the --force option to overwrite it') % outputname)
         try:
@@ -245,7 +405,8 @@ def main():
                                          complevel=args.complevel)
             else:
                 filters = None
-            hd5file = tables.openFile(filename=outputname, mode='w',
+            hd5file = tables.openFile(filename=outputname,
+                                      mode='a' if args.resume else 'w',
                                       title='Data', filters=filters)
         except IOError:
             sys.exit("Could not create %s" % outputname)
@@ -254,11 +415,17 @@ def main():
             convert(rootfile, hd5file,
                     entries=args.entries,
                     userfunc=userfunc,
-                    selection=args.selection)
+                    selection=args.selection,
+                    processes=args.processes,
+                    resume=args.resume)
             log.info("Created %s" % outputname)
         except KeyboardInterrupt:
-            log.info("Caught Ctrl-c ... cleaning up")
-            os.unlink(outputname)
+            if _resumable(hd5file):
+                log.info("Caught Ctrl-c ... "
+                         "run again with --resume to continue")
+            else:
+                log.info("Caught Ctrl-c ... cleaning up")
+                os.unlink(outputname)
             break
         finally:
             hd5file.close()
@@ -7,5 +7,7 @@ from .treetypes import *
 from .tree import Tree, Ntuple
 from .model import TreeModel
 from .chain import TreeChain, TreeQueue
+from .shard import Shard, shard_files
 from .cut import Cut
+from .usage import BranchUsage
 from .categories import Categories
@@ -0,0 +1,224 @@
+# Copyright 2012 the rootpy developers
+# distributed under the terms of the GNU General Public License
+"""
+This module implements an opt-in persistent cache of the results of
+``Tree.Draw`` (into a given histogram) and ``Tree.GetEntries`` with a
+selection. Results are keyed by the fingerprint (path, size and
+modification time) of the file containing the tree, the path of the tree,
+the expressions, the selection, the tree weight and the binning, so they
+are only reused while the file is unchanged. The least recently used
+results are evicted when the cache grows beyond its maximum size::
+
+    from rootpy.tree import cache
+    cache.enable()
+"""
+import os
+import hashlib
+import tempfile
+import cPickle as pickle
+
+from ..context import preserve_current_directory
+from .. import log; log = log[__name__]
+
+__all__ = [
+    'DrawCache',
+    'enable',
+    'disable',
+    'get_cache',
+]
+
+
+class DrawCache(object):
+    """
+    A directory of cached histograms and numbers of entries
+
+    Parameters
+    ----------
+    path : str, optional (default=None)
+        The cache directory. By default the directory ``drawcache`` in the
+        rootpy user data directory is used.
+
+    max_size : int, optional (default=1GB)
+        The maximum total size of the cached results in bytes
+    """
+    def __init__(self, path=None, max_size=2**30):
+
+        if path is None:
+            from .. import userdata
+            path = os.path.join(userdata.DATA_ROOT, 'drawcache')
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        self.path = path
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, tree, *args):
+        """
+        Return the key of a result computed from a tree (or from its entry
+        range) or None if the tree is not read from an unmodified local file
+        """
+        directory = tree.GetDirectory()
+        if not directory:
+            return None
+        tfile = directory.GetFile()
+        if not tfile or tfile.IsWritable() or '://' in tfile.GetName():
+            return None
+        filename = os.path.abspath(tfile.GetName())
+        try:
+            stat = os.stat(filename)
+        except OSError:
+            return None
+        # Draw only reads the entry range of a tree if one is set
+        fingerprint = (filename, stat.st_size, stat.st_mtime,
+                       directory.GetPath(), tree.GetName(),
+                       getattr(tree, '_entry_range', None))
+        return hashlib.sha1(repr(fingerprint + args)).hexdigest()
+
+    def _path(self, key, ext):
+
+        return os.path.join(self.path, key + ext)
+
+    def _touch(self, path):
+
+        try:
+            os.utime(path, None)
+            return True
+        except OSError:
+            return False
+
+    def get_hist(self, key):
+        """
+        Return the cached histogram or None
+        """
+        from ..io import root_open
+        path = self._path(key, '.root')
+        if not self._touch(path):
+            self.misses += 1
+            return None
+        try:
+            with preserve_current_directory():
+                with root_open(path) as rfile:
+                    hist = rfile.Get('hist')
+                    hist.SetDirectory(0)
+        except Exception as e:
+            log.warning("could not read cached histogram %s: %s" % (path, e))
+            self.misses += 1
+            return None
+        self.hits += 1
+        return hist
+
+    def set_hist(self, key, hist):
+        """
+        Store a histogram
+        """
+        from ..io import root_open
+        fd, tmp = tempfile.mkstemp(suffix='.root', dir=self.path)
+        os.close(fd)
+        with preserve_current_directory():
+            with root_open(tmp, 'recreate'):
+                hist.Write('hist')
+        os.rename(tmp, self._path(key, '.root'))
+        self.evict()
+
+    def get_value(self, key):
+        """
+        Return a cached number or None
+        """
+        path = self._path(key, '.pickle')
+        if not self._touch(path):
+            self.misses += 1
+            return None
+        try:
+            with open(path, 'rb') as f:
+                value = pickle.load(f)
+        except (IOError, EOFError, pickle.UnpicklingError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return value
+
+    def set_value(self, key, value):
+        """
+        Store a number
+        """
+        fd, tmp = tempfile.mkstemp(suffix='.pickle', dir=self.path)
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump(value, f, pickle.HIGHEST_PROTOCOL)
+        os.rename(tmp, self._path(key, '.pickle'))
+        self.evict()
+
+    def evict(self):
+        """
+        Remove the least recently used results until the total size of the
+        cache is below its maximum size
+        """
+        entries = []
+        total = 0
+        for name in os.listdir(self.path):
+            path = os.path.join(self.path, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+        if total <= self.max_size:
+            return
+        entries.sort()
+        for mtime, size, path in entries:
+            if total <= self.max_size:
+                break
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+            total -= size
+
+    def clear(self):
+        """
+        Remove all cached results
+        """
+        for name in os.listdir(self.path):
+            os.unlink(os.path.join(self.path, name))
+
+
+def binning(hist):
+    """
+    Return the type and the bin edges of a histogram
+    """
+    edges = []
+    for axis in xrange(1, hist.GetDimension() + 1):
+        ax = hist.axis(axis)
+        edges.append(tuple(ax.GetBinLowEdge(i)
+                           for i in xrange(1, ax.GetNbins() + 2)))
+    return (hist.__class__.__name__, tuple(edges))
+
+
+_CACHE = None
+
+
+def enable(path=None, max_size=2**30):
+    """
+    Cache the results of ``Tree.Draw`` into a given histogram and
+    ``Tree.GetEntries`` with a selection. See :class:`DrawCache` for the
+    arguments.
+    """
+    global _CACHE
+    _CACHE = DrawCache(path=path, max_size=max_size)
+    return _CACHE
+
+
+def disable():
+    """
+    Stop caching results
+    """
+    global _CACHE
+    _CACHE = None
+
+
+def get_cache():
+    """
+    Return the enabled cache or None
+    """
+    return _CACHE
@@ -1,14 +1,92 @@
 # Copyright 2012 the rootpy developers
 # distributed under the terms of the GNU General Public License
 import multiprocessing
+import threading
 import time
+from contextlib import contextmanager
+
+import ROOT
+
 from ..io import root_open, DoesNotExist
 from .filtering import EventFilterList
+from .shard import Shard
+from .tree import BaseTree
+from . import cache
+from .usage import BranchUsage
+from .. import QROOT
 from ..util.extras import humanize_bytes
 from .. import log; log = log[__name__]
 from ..context import preserve_current_directory
 
 
+def _warm_file(filename, status, budget=16777216, blocksize=4194304):
+    """
+    Validate a file and read its first ``budget`` bytes (the header and the
+    first baskets) so that they are in the OS page cache by the time the file
+    is opened with ROOT. Any error is recorded in ``status``.
+    """
+    try:
+        with open(filename, 'rb') as infile:
+            if infile.read(4) != 'root':
+                status['error'] = "not a ROOT file"
+                return
+            remaining = budget - 4
+            while remaining > 0:
+                data = infile.read(min(blocksize, remaining))
+                if not data:
+                    break
+                remaining -= len(data)
+    except (IOError, OSError) as e:
+        status['error'] = str(e)
+
+
+class FilePrefetcher(object):
+    """
+    Validate and read the beginning of upcoming files in background threads
+    while the current file is being consumed. This hides the latency of
+    opening files on network filesystems. Remote files (i.e. xrootd URLs)
+    are left alone since they are not accessible through the local
+    filesystem. Each file is only prefetched once, even if it is consumed
+    in several shards.
+
+    Parameters
+    ----------
+    budget : int, optional (default=16MB)
+        The number of bytes read from the beginning of each file
+    """
+    def __init__(self, budget=16777216):
+
+        self.budget = budget
+        self._pending = {}
+        self._errors = {}
+
+    def schedule(self, filenames):
+
+        for filename in filenames:
+            if (filename in self._pending or filename in self._errors or
+                    '://' in filename):
+                continue
+            status = {}
+            thread = threading.Thread(target=_warm_file,
+                                      args=(filename, status, self.budget))
+            thread.daemon = True
+            thread.start()
+            self._pending[filename] = (thread, status)
+
+    def wait(self, filename):
+        """
+        Wait until the file has been prefetched and return the error message
+        if it could not be read, otherwise None.
+        """
+        try:
+            thread, status = self._pending.pop(filename)
+        except KeyError:
+            return self._errors.get(filename)
+        thread.join()
+        self._errors[filename] = status.get('error', None)
+        return self._errors[filename]
+
+
 class BaseTreeChain(object):
 
     def __init__(self, name,
@@ -23,7 +101,9 @@ class BaseTreeChain(object):
                  learn_entries=10,
                  always_read=None,
                  ignore_unsupported=False,
-                 filters=None):
+                 filters=None,
+                 prefetch=0,
+                 branch_usage=None):
 
         self._name = name
         self._buffer = treebuffer
@@ -47,6 +127,16 @@ class BaseTreeChain(object):
         self._use_cache = cache
         self._cache_size = cache_size
         self._learn_entries = learn_entries
+        self._prefetch = prefetch
+        self._schema = None
+        self._plan = None
+        if isinstance(branch_usage, basestring):
+            branch_usage = BranchUsage(branch_usage)
+        self._usage = branch_usage
+        if prefetch > 0:
+            self._prefetcher = FilePrefetcher()
+        else:
+            self._prefetcher = None
 
         self.weight = 1.
         self.userdata = {}
@@ -81,10 +171,19 @@ class BaseTreeChain(object):
         """
         return None
 
+    def _peek_files(self, nfiles):
+        """
+        Return up to ``nfiles`` of the files that will follow the current
+        file without consuming them. Override in subclasses.
+        """
+        return []
+
     def always_read(self, branches):
 
         self._always_read = branches
         self._tree.always_read(branches)
+        if self._usage is not None:
+            self._usage.attach(self._tree, branches)
 
     def reset(self):
 
@@ -119,6 +218,26 @@ class BaseTreeChain(object):
 
         return self.Draw(*args, **kwargs)
 
+    def draw_many(self, requests, **kwargs):
+        '''
+        Loop over subfiles and fill many histograms in a single pass over each
+        tree. See ``rootpy.tree.Tree.draw_many``.
+        '''
+        self.reset()
+        while self._rollover():
+            self._tree.draw_many(requests, **kwargs)
+
+    def iterate_chunks(self, *args, **kwargs):
+        '''
+        Loop over subfiles and yield NumPy structured arrays for blocks of
+        entries. See ``rootpy.tree.Tree.iterate_chunks``. Blocks never span
+        more than one file.
+        '''
+        self.reset()
+        while self._rollover():
+            for chunk in self._tree.iterate_chunks(*args, **kwargs):
+                yield chunk
+
     def __getattr__(self, attr):
 
         try:
@@ -167,6 +286,8 @@ class BaseTreeChain(object):
             if not self._rollover():
                 break
         self._filters.finalize()
+        if self._usage is not None:
+            self._usage.save()
 
     def _rollover(self):
 
@@ -174,6 +295,19 @@ class BaseTreeChain(object):
         filename = self._next_file()
         if filename is None:
             return False
+        entry_range = None
+        if isinstance(filename, Shard):
+            filename, entry_range = filename.filename, filename[1:]
+        if self._prefetcher is not None:
+            error = self._prefetcher.wait(filename)
+            # start reading ahead while this file is being consumed
+            self._prefetcher.schedule([
+                getattr(item, 'filename', item)
+                for item in self._peek_files(self._prefetch)])
+            if error is not None:
+                log.warning("could not read file %s: %s (skipping)" %
+                    (filename, error))
+                return self._rollover()
         try:
             with preserve_current_directory():
                 self._file = root_open(filename)
@@ -191,19 +325,39 @@ class BaseTreeChain(object):
             log.warning("tree with no branches in file %s (skipping)" %
                 filename)
             return self._rollover()
-        if self._branches is not None:
-            self._tree.activate(self._branches, exclusive=True)
-        if self._ignore_branches is not None:
-            self._tree.deactivate(self._ignore_branches, exclusive=False)
-        if self._buffer is None:
-            self._tree.create_buffer(self._ignore_unsupported)
-            self._buffer = self._tree._buffer
+        schema = self._tree.schema_fingerprint()
+        if self._buffer is not None and schema == self._schema:
+            # same branches as the previous tree: replay the branch statuses
+            # and addresses instead of globbing and rebuilding the buffer
+            active, addresses = self._plan
+            if active is not None:
+                self._tree.SetBranchStatus('*', 0)
+                for name in active:
+                    self._tree.SetBranchStatus(name, 1)
+            for name, value in addresses:
+                self._tree.SetBranchAddress(name, value)
+            self._tree._buffer = self._buffer
         else:
-            self._tree.set_buffer(
-                    self._buffer,
-                    ignore_missing=True,
-                    transfer_objects=True)
+            if self._branches is not None:
+                self._tree.activate(self._branches, exclusive=True)
+            if self._ignore_branches is not None:
+                self._tree.deactivate(self._ignore_branches, exclusive=False)
+            if self._buffer is None:
+                self._tree.create_buffer(self._ignore_unsupported)
+            else:
+                self._tree.set_buffer(
+                        self._buffer,
+                        ignore_missing=True,
+                        transfer_objects=True)
             self._buffer = self._tree._buffer
+            active = None
+            if self._branches is not None or self._ignore_branches is not None:
+                active = [name for name in self._tree.iterbranchnames()
+                          if self._tree.GetBranchStatus(name)]
+            addresses = [(name, value) for name, value in self._buffer.items()
+                         if self._tree.has_branch(name)]
+            self._schema = schema
+            self._plan = (active, addresses)
         if self._use_cache:
             # enable TTreeCache for this tree
             log.info(("enabling a %s TTreeCache for the current tree "
@@ -213,6 +367,11 @@ class BaseTreeChain(object):
             self._tree.SetCacheLearnEntries(self._learn_entries)
         self._tree.read_branches_on_demand(self._read_branches_on_demand)
         self._tree.always_read(self._always_read)
+        if self._usage is not None:
+            self._usage.save()
+            self._usage.attach(self._tree, self._always_read)
+        if entry_range is not None:
+            self._tree.set_entry_range(*entry_range)
         self.weight = self._tree.GetWeight()
         for target, args in self._filechange_hooks:
             # run any user-defined functions
@@ -220,9 +379,61 @@ class BaseTreeChain(object):
         return True
 
 
+class _DrawChain(BaseTree, QROOT.TChain):
+    """
+    A TChain with the Draw method of rootpy Trees. ``files`` is a list of
+    (file name, number of entries) where the number of entries may be None
+    if it is not known yet.
+    """
+    def __init__(self, name, files):
+
+        super(_DrawChain, self).__init__(name=name)
+        self._post_init()
+        for filename, entries in files:
+            if entries is None:
+                self.Add(filename)
+            else:
+                # the file is not opened to count its entries
+                self.Add(filename, entries)
+
+
+@contextmanager
+def _ignore_root_errors():
+    """
+    Do not turn the errors of ROOT into exceptions
+    """
+    level = ROOT.gErrorIgnoreLevel
+    ROOT.gErrorIgnoreLevel = ROOT.kFatal
+    try:
+        yield
+    finally:
+        ROOT.gErrorIgnoreLevel = level
+
+
+def _draw_files(args):
+
+    name, files, expression, selection, options, hist, kwargs = args
+    hist.Reset()
+    _DrawChain(name, files).Draw(expression, selection, options, hist=hist,
+                                 **kwargs)
+    return hist
+
+
 class TreeChain(BaseTreeChain):
     """
     A ROOT.TChain replacement
+
+    ``files`` may contain :class:`rootpy.tree.shard.Shard` items in place of
+    file names to only iterate over a range of entries of a file.
+
+    Set ``prefetch`` to a positive number of files to validate and read the
+    beginning of that many upcoming files in background threads while the
+    current file is being consumed.
+
+    Set ``branch_usage`` to the name of the analysis (or a
+    :class:`rootpy.tree.usage.BranchUsage`) to record the branches accessed
+    through the buffer. Later runs with the same name only activate and
+    cache the recorded branches.
     """
     def __init__(self, name, files, **kwargs):
 
@@ -249,6 +460,83 @@ class TreeChain(BaseTreeChain):
         super(TreeChain, self).reset()
         self.curr_file_idx = 0
 
+    def Draw(self, expression, selection="", options="", hist=None,
+             processes=1, **kwargs):
+        '''
+        Draw from all files in a single pass over a TChain. The expression and
+        selection are compiled once and only their leaves are updated when the
+        next file is loaded, and a single histogram is filled. See
+        ``rootpy.tree.Tree.Draw`` for the arguments.
+
+        With ``processes`` greater than one, the files are split between a
+        pool of processes that each draw into an empty copy of ``hist``,
+        which is required, and the copies are added into ``hist``.
+
+        Files that cannot be opened or do not contain the tree are skipped as
+        when iterating over the chain.
+
+        Each file is drawn separately as with ``TreeQueue`` if the chain has
+        ``onfilechange`` hooks (so that they are run), if it contains shards
+        or if the Draw cache is enabled, in which case the result of each
+        file is cached.
+        '''
+        if (cache.get_cache() is not None or self._filechange_hooks or
+                any(isinstance(item, Shard) for item in self._files)):
+            return super(TreeChain, self).Draw(
+                expression, selection, options, hist=hist, **kwargs)
+        if processes > 1 and hist is None:
+            raise ValueError("a histogram is required to draw in parallel")
+        files = self._readable_files()
+        if not files:
+            return hist
+        if processes > 1:
+            processes = min(processes, len(files))
+            tasks = [(self._name, files[i::processes], expression,
+                      str(selection), options, hist, kwargs)
+                     for i in xrange(processes)]
+            pool = multiprocessing.Pool(processes)
+            try:
+                for output in pool.map(_draw_files, tasks):
+                    hist.Add(output)
+            finally:
+                pool.close()
+                pool.join()
+            return hist
+        chain = _DrawChain(self._name, files)
+        output = chain.Draw(expression, selection, options, hist=hist,
+                            **kwargs)
+        if hist is None and output:
+            # Make it memory resident
+            output = output.Clone()
+            output.SetDirectory(0)
+        return output
+
+    def _readable_files(self):
+        """
+        Return (file name, number of entries) for the files that can be
+        opened and contain the tree, warning about the other files as
+        ``_rollover`` does. A TChain counts the entries of each file before
+        drawing anyway, so the files are only checked while counting them and
+        the counts are passed on so that they are not opened again.
+        """
+        chain = QROOT.TChain(self._name)
+        for filename in self._files:
+            chain.Add(filename)
+        with _ignore_root_errors():
+            chain.GetEntries()
+        files = []
+        for element in chain.GetListOfFiles():
+            filename = element.GetTitle()
+            result = element.GetLoadResult()
+            if result == -3:
+                log.warning("could not open file %s (skipping)" % filename)
+            elif result < 0:
+                log.warning("tree %s does not exist in file %s (skipping)" %
+                    (self._name, filename))
+            elif element.GetEntries() > 0:
+                files.append((filename, element.GetEntries()))
+        return files
+
     def __len__(self):
 
         return len(self._files)
@@ -263,6 +551,10 @@ class TreeChain(BaseTreeChain):
         self.curr_file_idx += 1
         return filename
 
+    def _peek_files(self, nfiles):
+
+        return self._files[self.curr_file_idx:self.curr_file_idx + nfiles]
+
 
 class TreeQueue(BaseTreeChain):
 
@@ -273,8 +565,10 @@ class TreeQueue(BaseTreeChain):
         # For some reason, multiprocessing.queues d.n.e. until
         # one has been created (Mac OS)
         multiprocessing.Queue()
-        if not isinstance(files, multiprocessing.queues.Queue):
-            raise TypeError("files must be a multiprocessing.Queue")
+        if not (isinstance(files, multiprocessing.queues.Queue) or
+                hasattr(files, 'get')):
+            raise TypeError("files must be a multiprocessing.Queue or "
+                            "a rootpy.batch.scheduler.WorkQueue")
         self._files = files
 
         super(TreeQueue, self).__init__(name, **kwargs)
@@ -7,6 +7,7 @@ import ROOT
 from .. import log; log = log[__name__]
 from .. import QROOT
 from ..util import path
+from .expression import compile_expression, _length
 
 
 __all__ = ['Cut']
@@ -271,6 +272,38 @@ class Cut(QROOT.TCut):
         return re.sub('!(?!=)', '~',
             str(self).replace('&&', '&').replace('||', '|'))
 
+    def compile(self):
+        """
+        Return this cut compiled into a NumPy expression
+        (see :class:`rootpy.tree.expression.Expression`).
+        Raises a ValueError if the cut is empty.
+        """
+        if not self:
+            raise ValueError("cannot compile an empty cut")
+        return compile_expression(self)
+
+    def mask(self, arrays):
+        """
+        Evaluate this cut over columns of entries (i.e. the NumPy structured
+        array returned by ``Tree.to_array``) and return a boolean array that
+        is True for each entry passing the cut. An empty cut passes all
+        entries.
+        """
+        if not self:
+            import numpy as np
+            return np.ones(_length(arrays), dtype=bool)
+        return self.compile().mask(arrays)
+
+    def weights(self, arrays):
+        """
+        Evaluate this cut as a weighted selection over columns of entries and
+        return the weight of each entry. An empty cut gives unit weights.
+        """
+        if not self:
+            import numpy as np
+            return np.ones(_length(arrays), dtype=float)
+        return self.compile().weights(arrays)
+
     def replace(self, name, newname):
         """
         Replace all occurrences of name with newname
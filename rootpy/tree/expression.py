@@ -0,0 +1,357 @@
+# Copyright 2012 the rootpy developers
+# distributed under the terms of the GNU General Public License
+"""
+This module compiles TTreeFormula expressions (as used in Cuts and in
+Tree.Draw) into NumPy expressions that are evaluated over columns of entries,
+such as the structured arrays returned by ``Tree.to_array`` or
+``Tree.iterate_chunks``.
+"""
+import re
+
+from .. import log; log = log[__name__]
+
+__all__ = [
+    'Expression',
+    'compile_expression',
+]
+
+
+_TOKEN = re.compile(
+    r'\s*(?:'
+    r'(?P<number>(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?)|'
+    r'(?P<name>[a-zA-Z_][a-zA-Z0-9_]*(?:(?:\.|::)[a-zA-Z_][a-zA-Z0-9_]*)*)|'
+    r'(?P<op>&&|\|\||==|!=|<=|>=|<<|>>|[-+*/%<>!~&|^()\[\],=])'
+    r')')
+
+# binary operators from lowest to highest precedence
+_BINARY_LEVELS = [
+    ('||',),
+    ('&&',),
+    ('|',),
+    ('&',),
+    ('==', '!=', '='),
+    ('<', '<=', '>', '>='),
+    ('<<', '>>'),
+    ('+', '-'),
+    ('*', '/', '%'),
+    # the power operator of TFormula, not the exclusive or of C
+    ('^',),
+]
+
+_BINARY_TEMPLATES = {
+    '||': '_np.logical_or(%s, %s)',
+    '&&': '_np.logical_and(%s, %s)',
+    '|': '_np.bitwise_or(_int(%s), _int(%s))',
+    '&': '_np.bitwise_and(_int(%s), _int(%s))',
+    '==': '(%s == %s)',
+    '=': '(%s == %s)',
+    '!=': '(%s != %s)',
+    '<': '(%s < %s)',
+    '<=': '(%s <= %s)',
+    '>': '(%s > %s)',
+    '>=': '(%s >= %s)',
+    '<<': '_np.left_shift(_int(%s), _int(%s))',
+    '>>': '_np.right_shift(_int(%s), _int(%s))',
+    '+': '(%s + %s)',
+    '-': '(%s - %s)',
+    '*': '(%s * %s)',
+    # TTreeFormula evaluates everything in double precision
+    '/': '_np.true_divide(%s, %s)',
+    # ... except for the modulus which is computed on integers
+    '%': '_np.fmod(_int(%s), _int(%s))',
+    # the power operator of TFormula
+    '^': '_np.power(%s, %s, dtype=_np.float64)',
+}
+
+_UNARY_TEMPLATES = {
+    '!': '_np.logical_not(%s)',
+    '-': '(-%s)',
+    '+': '(+%s)',
+    '~': '_np.invert(_int(%s))',
+}
+
+_FUNCTIONS = {
+    'abs': '_np.abs',
+    'fabs': '_np.abs',
+    'sqrt': '_np.sqrt',
+    'exp': '_np.exp',
+    'log': '_np.log',
+    'log10': '_np.log10',
+    'pow': '_np.power',
+    'sin': '_np.sin',
+    'cos': '_np.cos',
+    'tan': '_np.tan',
+    'asin': '_np.arcsin',
+    'acos': '_np.arccos',
+    'atan': '_np.arctan',
+    'atan2': '_np.arctan2',
+    'sinh': '_np.sinh',
+    'cosh': '_np.cosh',
+    'tanh': '_np.tanh',
+    'min': '_np.minimum',
+    'max': '_np.maximum',
+    'int': '_int',
+    'TMath::Abs': '_np.abs',
+    'TMath::Sqrt': '_np.sqrt',
+    'TMath::Exp': '_np.exp',
+    'TMath::Log': '_np.log',
+    'TMath::Log10': '_np.log10',
+    'TMath::Power': '_np.power',
+    'TMath::Sin': '_np.sin',
+    'TMath::Cos': '_np.cos',
+    'TMath::Tan': '_np.tan',
+    'TMath::ASin': '_np.arcsin',
+    'TMath::ACos': '_np.arccos',
+    'TMath::ATan': '_np.arctan',
+    'TMath::ATan2': '_np.arctan2',
+    'TMath::Min': '_np.minimum',
+    'TMath::Max': '_np.maximum',
+    'TMath::Floor': '_np.floor',
+    'TMath::Ceil': '_np.ceil',
+    'TMath::Pi': '_np.pi',
+}
+
+_CONSTANTS = {
+    'true': '1',
+    'false': '0',
+    'kTRUE': '1',
+    'kFALSE': '0',
+    'pi': '_np.pi',
+}
+
+
+def _int(value):
+
+    import numpy as np
+    return np.trunc(value).astype(np.int64)
+
+
+def _tokenize(expression):
+
+    tokens = []
+    pos = 0
+    expression = expression.rstrip()
+    while pos < len(expression):
+        match = _TOKEN.match(expression, pos)
+        if not match or match.end() == pos:
+            raise ValueError(
+                "unable to parse expression '%s' at position %d" %
+                (expression, pos))
+        pos = match.end()
+        for kind in ('number', 'name', 'op'):
+            value = match.group(kind)
+            if value is not None:
+                tokens.append((kind, value))
+                break
+    return tokens
+
+
+class _Parser(object):
+    """
+    A recursive descent parser translating a TTreeFormula expression into
+    Python source using NumPy ufuncs. Every operation is explicitly
+    parenthesized since the precedence of the bitwise operators used by NumPy
+    differs from the C operators they replace.
+    """
+    def __init__(self, expression):
+
+        self.expression = expression
+        self.tokens = _tokenize(expression)
+        self.pos = 0
+        self.names = []
+
+    def error(self, msg):
+
+        raise ValueError("%s in expression '%s'" % (msg, self.expression))
+
+    def peek(self):
+
+        if self.pos < len(self.tokens):
+            return self.tokens[self.pos]
+        return None, None
+
+    def take(self, value=None):
+
+        kind, token = self.peek()
+        if kind is None:
+            self.error("unexpected end")
+        if value is not None and token != value:
+            self.error("expected '%s' but found '%s'" % (value, token))
+        self.pos += 1
+        return kind, token
+
+    def parse(self):
+
+        if not self.tokens:
+            self.error("empty expression")
+        source = self.binary(0)
+        if self.pos != len(self.tokens):
+            self.error("unexpected '%s'" % self.peek()[1])
+        return source
+
+    def binary(self, level):
+
+        if level == len(_BINARY_LEVELS):
+            return self.unary()
+        left = self.binary(level + 1)
+        while True:
+            kind, token = self.peek()
+            if kind != 'op' or token not in _BINARY_LEVELS[level]:
+                return left
+            self.take()
+            right = self.binary(level + 1)
+            left = _BINARY_TEMPLATES[token] % (left, right)
+
+    def unary(self):
+
+        kind, token = self.peek()
+        if kind == 'op' and token in _UNARY_TEMPLATES:
+            self.take()
+            return _UNARY_TEMPLATES[token] % self.unary()
+        return self.primary()
+
+    def primary(self):
+
+        kind, token = self.take()
+        if kind == 'number':
+            return token
+        if kind == 'op':
+            if token != '(':
+                self.error("unexpected '%s'" % token)
+            source = self.binary(0)
+            self.take(')')
+            return '(%s)' % source
+        # a name
+        if self.peek()[1] == '(':
+            return self.call(token)
+        if token in _CONSTANTS:
+            return _CONSTANTS[token]
+        if '$' in token or '::' in token:
+            self.error("unsupported name '%s'" % token)
+        if token not in self.names:
+            self.names.append(token)
+        source = '_v[%r]' % token
+        while self.peek()[1] == '[':
+            self.take('[')
+            kind, index = self.take()
+            if kind != 'number' or not index.isdigit():
+                self.error("only constant integer indices are supported")
+            self.take(']')
+            source = '%s[:, %s]' % (source, index)
+        return source
+
+    def call(self, name):
+
+        if name not in _FUNCTIONS:
+            self.error("unsupported function '%s'" % name)
+        self.take('(')
+        args = []
+        if self.peek()[1] != ')':
+            args.append(self.binary(0))
+            while self.peek()[1] == ',':
+                self.take(',')
+                args.append(self.binary(0))
+        self.take(')')
+        func = _FUNCTIONS[name]
+        if name == 'TMath::Pi':
+            if args:
+                self.error("TMath::Pi takes no arguments")
+            return func
+        return '%s(%s)' % (func, ', '.join(args))
+
+
+class Expression(object):
+    """
+    A TTreeFormula expression compiled into a NumPy expression
+
+    Parameters
+    ----------
+    expression : str
+        The expression, i.e. ``"a_x>0&&sqrt(a_y)<4"``
+
+    Attributes
+    ----------
+    branches : list
+        The names of the branches required to evaluate the expression in
+        order of appearance.
+
+    source : str
+        The generated Python source.
+    """
+    def __init__(self, expression):
+
+        self.expression = str(expression)
+        parser = _Parser(self.expression)
+        self.source = parser.parse()
+        self.branches = parser.names
+        self._code = compile(self.source, '<expression>', 'eval')
+
+    def __call__(self, arrays):
+        """
+        Evaluate the expression over columns of entries
+
+        Parameters
+        ----------
+        arrays : NumPy structured array or dict
+            The columns of entries. Any object that maps a branch name onto
+            an array with ``arrays[name]`` is accepted.
+
+        Returns
+        -------
+        values : NumPy array
+            The value of the expression for each entry.
+        """
+        import numpy as np
+        values = eval(self._code,
+                      {'_np': np, '_int': _int, '__builtins__': {}},
+                      {'_v': arrays})
+        values = np.asarray(values)
+        if values.ndim == 0:
+            # the expression is a constant
+            values = np.repeat(values, _length(arrays))
+        return values
+
+    def mask(self, arrays):
+        """
+        Evaluate the expression as a selection and return a boolean array that
+        is True for each entry passing the selection.
+        """
+        return self(arrays) != 0
+
+    def weights(self, arrays):
+        """
+        Evaluate the expression as a weight and return a float array with the
+        weight of each entry (zero for entries failing the selection).
+        """
+        return self(arrays).astype(float)
+
+    def __repr__(self):
+
+        return "%s('%s')" % (self.__class__.__name__, self.expression)
+
+
+def _length(arrays):
+
+    if hasattr(arrays, 'dtype'):
+        return len(arrays)
+    for value in arrays.values():
+        return len(value)
+    return 0
+
+
+_CACHE = {}
+
+
+def compile_expression(expression):
+    """
+    Return the compiled :class:`Expression` for ``expression``. Compiled
+    expressions are cached so repeated calls with the same expression are
+    cheap.
+    """
+    expression = str(expression)
+    try:
+        return _CACHE[expression]
+    except KeyError:
+        compiled = Expression(expression)
+        _CACHE[expression] = compiled
+        return compiled
@@ -0,0 +1,89 @@
+# Copyright 2012 the rootpy developers
+# distributed under the terms of the GNU General Public License
+"""
+This module splits trees into ranges of entries (shards) so that a single
+large tree can be processed by many processes in parallel. Shards are
+accepted by TreeChain in place of file names.
+"""
+from collections import namedtuple
+
+from ..io import root_open, DoesNotExist
+from ..context import preserve_current_directory
+from .. import log; log = log[__name__]
+
+__all__ = [
+    'Shard',
+    'shard_files',
+]
+
+
+class Shard(namedtuple('Shard', 'filename start stop')):
+    """
+    A range of entries from ``start`` up to but not including ``stop`` in
+    the tree of a file
+    """
+    def __str__(self):
+
+        return "%s[%d:%d]" % self
+
+    @property
+    def entries(self):
+
+        return self.stop - self.start
+
+
+def _split(boundaries, entries_per_shard):
+
+    ranges = []
+    start = boundaries[0]
+    for boundary in boundaries[1:]:
+        if boundary - start >= entries_per_shard:
+            ranges.append((start, boundary))
+            start = boundary
+    if boundaries[-1] > start:
+        ranges.append((start, boundaries[-1]))
+    return ranges
+
+
+def shard_files(files, treename, entries_per_shard):
+    """
+    Split the trees in a list of files into shards of at least
+    ``entries_per_shard`` entries (except for the last shard of each file).
+    Shards start and stop on cluster boundaries (see
+    ``Tree.cluster_boundaries``) so no basket is read by more than one shard.
+
+    Parameters
+    ----------
+    files : list
+        The file names
+
+    treename : str
+        The name of the tree (including the path) in each file
+
+    entries_per_shard : int
+        The minimum number of entries in each shard
+
+    Returns
+    -------
+    shards : list of Shard
+    """
+    if entries_per_shard < 1:
+        raise ValueError("entries_per_shard must be at least 1")
+    shards = []
+    for filename in files:
+        try:
+            with preserve_current_directory():
+                with root_open(filename) as rfile:
+                    tree = rfile.Get(treename)
+                    boundaries = tree.cluster_boundaries()
+        except IOError:
+            log.warning("could not open file %s (skipping)" % filename)
+            continue
+        except DoesNotExist:
+            log.warning("tree %s does not exist in file %s (skipping)" %
+                (treename, filename))
+            continue
+        for start, stop in _split(boundaries, entries_per_shard):
+            shards.append(Shard(filename, start, stop))
+    log.info("split %i file(s) into %i shard(s)" % (len(files), len(shards)))
+    return shards
@@ -0,0 +1,76 @@
+# Copyright 2012 the rootpy developers
+# distributed under the terms of the GNU General Public License
+from rootpy.tree.expression import Expression, compile_expression
+from rootpy.tree import Cut
+from nose.tools import assert_equal, assert_raises
+from nose.plugins.skip import SkipTest
+
+
+def setup():
+
+    try:
+        __import__('numpy')
+    except ImportError:
+        raise SkipTest("numpy is not installed")
+
+
+def _arrays():
+
+    import numpy as np
+    arrays = np.zeros(4, dtype=[('a', 'f8'), ('b', 'i4'), ('c', 'i4')])
+    arrays['a'] = [-1, 1, 2, 3]
+    arrays['b'] = [0, 2, 2, 0]
+    arrays['c'] = [1, 2, 3, 4]
+    return arrays
+
+
+def test_precedence():
+
+    arrays = _arrays()
+    assert_equal(list(Expression('a>0&&b<1').mask(arrays)),
+                 [False, False, False, True])
+    assert_equal(list(Expression('a>0&&b==2||c==1').mask(arrays)),
+                 [True, True, True, False])
+    assert_equal(list(Expression('!(a>0)').mask(arrays)),
+                 [True, False, False, False])
+    assert_equal(list(Expression('b/4+c%2').weights(arrays)),
+                 [1., .5, 1.5, 0.])
+    # ^ is the power operator and binds tighter than *
+    assert_equal(list(Expression('2*c^2').weights(arrays)),
+                 [2., 8., 18., 32.])
+    assert_equal(list(Expression('sqrt(a^2+b^2)>2').mask(arrays)),
+                 [False, True, True, True])
+    assert_equal(Expression('sqrt(a)*TMath::Abs(b)-c').branches,
+                 ['a', 'b', 'c'])
+
+
+def test_constant():
+
+    arrays = _arrays()
+    assert_equal(list(Expression('1').mask(arrays)), [True] * 4)
+
+
+def test_invalid():
+
+    assert_raises(ValueError, Expression, 'a?b:c')
+    assert_raises(ValueError, Expression, 'foo(a)')
+    assert_raises(ValueError, Expression, '(a>0')
+
+
+def test_cache():
+
+    assert_equal(compile_expression('a>0') is compile_expression('a>0'), True)
+
+
+def test_cut():
+
+    arrays = _arrays()
+    cut = Cut('0<a<3') & Cut('b==2')
+    assert_equal(list(cut.mask(arrays)), [False, True, True, False])
+    assert_equal(list((cut * 'c').weights(arrays)), [0., 2., 3., 0.])
+    assert_equal(list(Cut().mask(arrays)), [True] * 4)
+
+
+if __name__ == "__main__":
+    import nose
+    nose.runmodule()
@@ -3,6 +3,9 @@
 import ROOT
 from rootpy.math.physics.vector import LorentzVector
 from rootpy.tree import Tree, Ntuple, TreeModel, TreeChain
+from rootpy.tree import Shard, shard_files
+from rootpy.tree.chain import FilePrefetcher
+from rootpy.tree import cache, BranchUsage
 from rootpy.io import root_open, TemporaryFile
 from rootpy.tree.treetypes import FloatCol, IntCol
 from rootpy.plotting import Hist, Hist2D, Hist3D
@@ -12,8 +15,11 @@ from rootpy import stl
 from random import gauss, randint, random
 import re
 import os
+import shutil
+import tempfile
 
 from nose.tools import assert_raises, assert_almost_equal, assert_equals, raises
+from nose.plugins.skip import SkipTest
 from unittest import TestCase
 
 
@@ -125,6 +131,235 @@ class TreeTests(TestCase):
         chain.draw('a_x', hist=hist2)
         assert_equals(hist.Integral(), hist2.Integral())
 
+        # drawing in parallel or from shards gives the same result
+        hist3 = Hist(100, 0, 1)
+        chain.draw('a_x', hist=hist3, processes=2, linecolor='red')
+        assert_equals(hist.Integral(), hist3.Integral())
+        hist4 = Hist(100, 0, 1)
+        TreeChain('tree', shard_files(self.file_paths, 'tree', 1000)).draw(
+            'a_x', hist=hist4)
+        assert_equals(hist.Integral(), hist4.Integral())
+
+        # files without the tree are skipped and onfilechange hooks are run
+        changes = []
+        def onfilechange(name, file, tree):
+            changes.append(name)
+        with TemporaryFile() as empty:
+            ROOT.TFile.Close(empty)
+            for kwargs in ({}, {'onfilechange': [(onfilechange, ())]}):
+                hist5 = Hist(100, 0, 1)
+                TreeChain('tree', self.file_paths + [empty.GetName()],
+                          **kwargs).draw('a_x', hist=hist5)
+                assert_equals(hist.Integral(), hist5.Integral())
+        # once on initialization and once per file while drawing
+        assert_equals(len(changes), len(self.file_paths) + 1)
+        # missing files are skipped too
+        hist6 = Hist(100, 0, 1)
+        TreeChain('tree', self.file_paths + ['does_not_exist.root']).draw(
+            'a_x', hist=hist6)
+        assert_equals(hist.Integral(), hist6.Integral())
+
+    def test_draw_many(self):
+
+        try:
+            __import__('root_numpy')
+        except ImportError:
+            raise SkipTest("root_numpy is not installed")
+
+        with root_open(self.file_paths[0]) as f:
+            tree = f.tree
+            requests = [
+                ('a_x', '', Hist(10, -1, 2)),
+                ('a_x', 'a_y>0', Hist(10, -1, 2)),
+                ('a_x:a_y', 'a_z*(a_y>0)', Hist2D(10, -2, 3, 12, -1, 6)),
+                ('b_n', 'a_x>0', Hist(5, 1, 6)),
+                # not plain branches: drawn separately
+                ('sum_xy', 'a_x>0', Hist(10, -3, 3)),
+                ('2', '', Hist(5, 0, 5))]
+            tree.SetAlias('sum_xy', 'a_x+a_y')
+            tree.draw_many(requests)
+            for expression, selection, hist in requests:
+                expected = hist.Clone()
+                expected.Reset()
+                tree.draw(expression, selection, hist=expected)
+                assert_almost_equal(hist.Integral(), expected.Integral(),
+                                    places=3)
+                assert_equals(hist.GetEntries(), expected.GetEntries())
+                for axis in range(1, hist.GetDimension() + 1):
+                    assert_almost_equal(hist.GetMean(axis),
+                                        expected.GetMean(axis), places=3)
+
+    def test_entry_range(self):
+
+        with root_open(self.file_paths[0]) as f:
+            tree = f.tree
+            tree.set_entry_range(100, 200)
+            assert_equals([event.i for event in tree], range(100, 200))
+            tree.read_branches_on_demand(True)
+            assert_equals([event.i for event in tree], range(100, 200))
+            boundaries = tree.cluster_boundaries()
+            assert_equals(boundaries[0], 0)
+            assert_equals(boundaries[-1], 10000)
+
+    def test_shards(self):
+
+        shards = shard_files(self.file_paths, 'tree', 1000)
+        assert_equals(sum(s.entries for s in shards), 50000)
+        chain = TreeChain('tree', shards)
+        assert_equals(len([event for event in chain]), 50000)
+
+        chain = TreeChain('tree', [Shard(self.file_paths[0], 10, 20),
+                                   Shard(self.file_paths[1], 30, 35)])
+        assert_equals([event.i for event in chain],
+                      range(10, 20) + range(30, 35))
+
+    def test_shards_chunks(self):
+
+        try:
+            __import__('root_numpy')
+        except ImportError:
+            raise SkipTest("root_numpy is not installed")
+
+        # each entry is read exactly once from the shards of a file
+        shards = shard_files(self.file_paths[:1], 'tree', 3000)
+        assert len(shards) > 1
+        chain = TreeChain('tree', shards)
+        indices = []
+        for chunk in chain.iterate_chunks(['i'], chunk_size=1000):
+            indices.extend(chunk['i'])
+        assert_equals(sorted(indices), range(10000))
+
+        hist = Hist(10000, -.5, 9999.5)
+        chain.draw_many([('i', '', hist)])
+        assert_equals(hist.GetEntries(), 10000)
+        assert_equals(hist.GetMaximum(), 1)
+        assert_equals(hist.GetMinimum(), 1)
+
+        with root_open(self.file_paths[0]) as f:
+            tree = f.tree
+            tree.set_entry_range(2500, 7000)
+            chunks = list(tree.iterate_chunks(['i'], chunk_size=2000))
+            assert_equals([len(chunk) for chunk in chunks], [2000, 2000, 500])
+            assert_equals(chunks[0]['i'][0], 2500)
+
+    def test_chain_schema_reuse(self):
+
+        chain = TreeChain('tree', self.file_paths, branches=['a_*', 'i'])
+        total = 0
+        for event in chain:
+            total += event.i
+        # the files have the same schema so the branch addresses of the
+        # first tree are replayed for the following trees
+        assert_equals(total, len(self.file_paths) * sum(xrange(10000)))
+        assert_equals(sorted(chain._plan[0]), ['a_x', 'a_y', 'a_z', 'i'])
+
+    def test_chain_branch_usage(self):
+
+        fd, filename = tempfile.mkstemp(suffix='.json')
+        os.close(fd)
+        os.unlink(filename)
+        try:
+            # the first run records the accessed branches
+            usage = BranchUsage('test', filename=filename)
+            chain = TreeChain('tree', self.file_paths[:2],
+                              read_branches_on_demand=True,
+                              branch_usage=usage)
+            for event in chain:
+                event.i
+                event.a_x
+            assert_equals(sorted(usage.branches), ['a_x', 'i'])
+            # the next run only activates the recorded branches
+            usage = BranchUsage('test', filename=filename)
+            assert usage.prune
+            chain = TreeChain('tree', self.file_paths[:2],
+                              read_branches_on_demand=True,
+                              cache=True,
+                              branch_usage=usage)
+            assert not chain._tree.GetBranchStatus('a_y')
+            total = 0
+            for event in chain:
+                total += event.i
+                # not recorded: activated and read on first access
+                assert_equals(event.a_y, event.a_y)
+            assert_equals(total, 2 * sum(xrange(10000)))
+            assert_equals(sorted(usage.branches), ['a_x', 'a_y', 'i'])
+        finally:
+            if os.path.exists(filename):
+                os.unlink(filename)
+
+    def test_chain_prefetch(self):
+
+        chain = TreeChain('tree', self.file_paths, prefetch=2)
+        entries = 0
+        for event in chain:
+            entries += 1
+        assert_equals(entries, 10000 * len(self.file_paths))
+
+        # unreadable files are skipped
+        chain = TreeChain('tree', self.file_paths[:1] + ['does_not_exist.root'] +
+                          self.file_paths[1:2], prefetch=2)
+        entries = 0
+        for event in chain:
+            entries += 1
+        assert_equals(entries, 20000)
+
+        # files are only prefetched once across shard rollovers
+        prefetcher = FilePrefetcher(budget=1024)
+        prefetcher.schedule(self.file_paths[:1])
+        assert_equals(prefetcher.wait(self.file_paths[0]), None)
+        prefetcher.schedule(self.file_paths[:1])
+        assert_equals(len(prefetcher._pending), 0)
+        assert_equals(prefetcher.wait(self.file_paths[0]), None)
+
+    def test_iterate_chunks(self):
+
+        try:
+            __import__('root_numpy')
+        except ImportError:
+            raise SkipTest("root_numpy is not installed")
+
+        with root_open(self.file_paths[0]) as f:
+            tree = f.tree
+            chunks = list(tree.iterate_chunks(['a_x', 'i'], chunk_size=3000))
+            assert_equals(len(chunks), 4)
+            assert_equals(sum(len(chunk) for chunk in chunks),
+                          tree.GetEntries())
+            assert_equals(chunks[0].dtype.names, ('a_x', 'i'))
+            assert_equals(list(chunks[1]['i'][:2]), [3000, 3001])
+
+        chain = TreeChain('tree', self.file_paths)
+        total = sum(len(chunk) for chunk in
+                    chain.iterate_chunks('a_*', chunk_size=4000))
+        assert_equals(total, 10000 * len(self.file_paths))
+
+    def test_draw_cache(self):
+
+        tmpdir = tempfile.mkdtemp()
+        try:
+            drawcache = cache.enable(path=tmpdir)
+            for _ in xrange(2):
+                with root_open(self.file_paths[0]) as f:
+                    hist = Hist(10, -3, 3)
+                    f.tree.Draw('a_x', 'a_y>0', hist=hist)
+                    entries = f.tree.GetEntries('a_y>0')
+                assert_equals(hist.GetEntries(), entries)
+            assert_equals(drawcache.misses, 2)
+            assert_equals(drawcache.hits, 2)
+            # the least recently used results are evicted
+            drawcache.max_size = 1
+            drawcache.evict()
+            assert_equals(os.listdir(tmpdir), [])
+            # shards of the same file are cached separately
+            shards = [Shard(self.file_paths[0], 0, 1000),
+                      Shard(self.file_paths[0], 1000, 3000)]
+            for _ in xrange(2):
+                hist = Hist(10, -3, 3)
+                TreeChain('tree', shards).draw('a_x', hist=hist)
+                assert_equals(hist.GetEntries(), 3000)
+        finally:
+            cache.disable()
+            shutil.rmtree(tmpdir)
+
     def test_chain_draw_hist_init_first(self):
 
         hist = Hist(100, 0, 1)
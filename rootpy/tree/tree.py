@@ -16,6 +16,7 @@ from .. import log; log = log[__name__]
 from .. import asrootpy, QROOT
 from ..memory.keepalive import keepalive
 from .cut import Cut
+from . import cache
 from .treebuffer import TreeBuffer
 from .treetypes import Variable
 from .model import TreeModel
@@ -33,6 +34,7 @@ class BaseTree(NamedObject): # Plottable
 
     DRAW_PATTERN = re.compile(
             '^(?P<branches>.+?)(?P<redirect>\>\>[\+]?(?P<name>[^\(]+).*)?$')
+    EXPRESSION_SEP = re.compile('(?<!:):(?!:)')
 
     def _post_init(self):
         """
@@ -46,6 +48,7 @@ class BaseTree(NamedObject): # Plottable
         self._branch_cache = {}
         self._current_entry = 0
         self._always_read = []
+        self._entry_range = None
         self.userdata = UserData()
         self._inited = True
 
@@ -81,6 +84,54 @@ class BaseTree(NamedObject): # Plottable
         self._buffer.set_tree(self if read else None)
         self._branched_on_demand = read
 
+    def set_entry_range(self, start=0, stop=None):
+        """
+        Only iterate over, draw and read in chunks the entries from ``start``
+        up to but not including ``stop``. This does not affect GetEntries.
+
+        Parameters
+        ----------
+        start : int, optional (default=0)
+            The first entry
+
+        stop : int, optional (default=None)
+            Stop before this entry. If None then iterate up to the last entry.
+        """
+        if start == 0 and stop is None:
+            self._entry_range = None
+        else:
+            self._entry_range = (start, stop)
+
+    def _entry_bounds(self):
+        """
+        Return the first entry and the entry after the last entry of the
+        range set with ``set_entry_range``
+        """
+        entries = self.GetEntries()
+        if self._entry_range is None:
+            return 0, entries
+        start, stop = self._entry_range
+        if stop is None or stop > entries:
+            stop = entries
+        return start, stop
+
+    def cluster_boundaries(self):
+        """
+        Return the list of the first entries of each cluster of baskets
+        followed by the number of entries in the Tree. Reading ranges of
+        entries starting and ending on these boundaries never reads the same
+        basket twice.
+        """
+        entries = self.GetEntries()
+        boundaries = []
+        clusters = self.GetClusterIterator(0)
+        start = clusters.Next()
+        while start < entries:
+            boundaries.append(start)
+            start = clusters.Next()
+        boundaries.append(entries)
+        return boundaries
+
     @classmethod
     def branch_type(cls, branch):
         """
@@ -314,6 +365,15 @@ class BaseTree(NamedObject): # Plottable
         for branch in self.iterbranches():
             yield branch.GetName()
 
+    def schema_fingerprint(self):
+        """
+        Return a hashable summary of the branches (names, types and number
+        of leaves) that is equal for trees with the same schema
+        """
+        return tuple((branch.GetName(), branch.GetClassName(),
+                      branch.GetTitle(), branch.GetNleaves())
+                     for branch in self.iterbranches())
+
     def glob(self, patterns, exclude=None):
         """
         Return a list of branch names that match ``pattern``.
@@ -389,8 +449,10 @@ class BaseTree(NamedObject): # Plottable
         """
         if not self._buffer:
             self.create_buffer()
+        start, stop = self._entry_bounds()
         if self._branched_on_demand:
-            for i in xrange(self.GetEntries()):
+            self._buffer._current_entry = start
+            for i in xrange(start, stop):
                 # Only increment current entry.
                 # getattr on a branch will then GetEntry on only that branch
                 # see ``TreeBuffer.get_with_read_if_cached``.
@@ -419,7 +481,7 @@ class BaseTree(NamedObject): # Plottable
                 self._buffer.next_entry()
                 self._buffer.reset_collections()
         else:
-            for i in xrange(self.GetEntries()):
+            for i in xrange(start, stop):
                 # Read all activated branches (can be slow!).
                 super(BaseTree, self).GetEntry(i)
                 self._buffer._entry.set(i)
@@ -564,6 +626,24 @@ class BaseTree(NamedObject): # Plottable
         weighted : bool, optional (default=False)
             Multiply the number of (weighted) entries by the Tree weight.
         """
+        drawcache = cache.get_cache()
+        key = None
+        if drawcache is not None and (cut or weighted_cut):
+            key = drawcache.key(self, 'GetEntries',
+                                str(cut or ''), str(weighted_cut or ''))
+        if key is not None:
+            entries = drawcache.get_value(key)
+            if entries is None:
+                entries = self._get_entries(cut, weighted_cut)
+                drawcache.set_value(key, entries)
+        else:
+            entries = self._get_entries(cut, weighted_cut)
+        if weighted:
+            entries *= self.GetWeight()
+        return entries
+
+    def _get_entries(self, cut, weighted_cut):
+
         if weighted_cut:
             hist = Hist(1, -1, 2)
             branch = self.GetListOfBranches()[0].GetName()
@@ -577,8 +657,6 @@ class BaseTree(NamedObject): # Plottable
             entries = super(BaseTree, self).GetEntries(str(cut))
         else:
             entries = super(BaseTree, self).GetEntries()
-        if weighted:
-            entries *= self.GetWeight()
         return entries
 
     def GetMaximum(self, expression, cut=None):
@@ -669,7 +747,29 @@ class BaseTree(NamedObject): # Plottable
         If ``hist`` is specified, None is returned. If ``hist`` is left
         unspecified, an attempt is made to retrieve the generated histogram
         which is then returned.
-        """
+
+        If the cache is enabled (see :mod:`rootpy.tree.cache`) and ``hist``
+        is specified, the result is added from the cache if the same
+        expression was drawn before from the unchanged file with the same
+        selection, options, tree weight and binning.
+        """
+        drawcache = cache.get_cache()
+        if drawcache is not None and hist is not None:
+            key = drawcache.key(self, 'Draw', expression, str(selection),
+                                options, self.GetWeight(), cache.binning(hist))
+            if key is not None:
+                result = drawcache.get_hist(key)
+                if result is None:
+                    result = hist.Clone()
+                    result.Reset()
+                    self._draw(expression, selection, options, result)
+                    drawcache.set_hist(key, result)
+                hist.Add(result)
+                return hist
+        return self._draw(expression, selection, options, hist, **kwargs)
+
+    def _draw(self, expression, selection, options, hist, **kwargs):
+
         if isinstance(expression, (list, tuple)):
             expressions = expression
         else:
@@ -718,7 +818,12 @@ class BaseTree(NamedObject): # Plottable
                     context = do_nothing()
 
                 with context:
-                    super(BaseTree, self).Draw(expr, selection, options)
+                    if self._entry_range is not None:
+                        start, stop = self._entry_bounds()
+                        super(BaseTree, self).Draw(
+                            expr, selection, options, stop - start, start)
+                    else:
+                        super(BaseTree, self).Draw(expr, selection, options)
 
         if hist is None:
             # Retrieve histogram made by TTree
@@ -743,6 +848,116 @@ class BaseTree(NamedObject): # Plottable
 
         return hist
 
+    def draw_many(self, requests, chunk_size=100000):
+        """
+        Fill many histograms in a single pass over the tree. Branches are read
+        once in blocks of entries and shared by all expressions and
+        selections, instead of scanning the whole tree for each histogram as
+        with repeated calls to ``Draw``.
+
+        Parameters
+        ----------
+        requests : list of (expression, selection, hist) tuples
+            ``expression`` and ``selection`` follow the conventions of
+            ``Draw`` (i.e. "X:Y" for a 2D histogram) and ``hist`` is the
+            histogram to be filled. Entries are weighted by the selection
+            and the Tree weight as in ``Draw``. Requests filling profiles or
+            with expressions that cannot be compiled into NumPy expressions
+            (see :mod:`rootpy.tree.expression`), that do not only use
+            branches of basic types of this tree (i.e. aliases or branches of
+            friend trees) or that do not use any branch fall back to a
+            separate ``Draw``.
+
+        chunk_size : int, optional (default=100000)
+            The number of entries read at once.
+        """
+        import numpy as np
+        from .expression import compile_expression
+        from ..plotting.profile import _ProfileBase
+
+        compiled = []
+        fallback = []
+        for expression, selection, hist in requests:
+            selection = Cut(selection)
+            if isinstance(hist, _ProfileBase):
+                # profiles cannot be filled with arrays
+                fallback.append((expression, selection, hist))
+                continue
+            try:
+                expressions = [
+                    compile_expression(expr) for expr in
+                    BaseTree.EXPRESSION_SEP.split(expression)]
+                compiled_selection = selection.compile() if selection else None
+            except ValueError as e:
+                log.warning("%s (falling back on Draw)" % e)
+                fallback.append((expression, selection, hist))
+                continue
+            if len(expressions) != hist.GetDimension():
+                raise ValueError(
+                    "dimension of expression '%s' does not match "
+                    "dimension of histogram %s" % (expression, hist.GetName()))
+            compiled.append(
+                ((expression, selection, hist),
+                 expressions, compiled_selection))
+
+        # only plain branches of this tree are read as columns. Aliases,
+        # branches of friend trees and members of objects are left to Draw,
+        # as are expressions not using any branch.
+        plain = set(branch.GetName() for branch in self.GetListOfBranches())
+        branches = set()
+        for item in compiled[:]:
+            _, expressions, selection = item
+            used = set()
+            for expr in expressions:
+                used.update(expr.branches)
+            if selection is not None:
+                used.update(selection.branches)
+            if not used or not used <= plain:
+                compiled.remove(item)
+                fallback.append(item[0])
+                continue
+            branches.update(used)
+
+        tree_weight = self.GetWeight()
+        first_chunk = True
+        if compiled:
+            for chunk in self.iterate_chunks(sorted(branches),
+                                             chunk_size=chunk_size):
+                if first_chunk:
+                    # columns of non-basic types cannot be filled vectorized
+                    objects = set(name for name in chunk.dtype.names
+                                  if chunk.dtype[name].kind == 'O')
+                    for item in compiled[:]:
+                        _, expressions, selection = item
+                        used = set()
+                        for expr in expressions:
+                            used.update(expr.branches)
+                        if selection is not None:
+                            used.update(selection.branches)
+                        if used & objects:
+                            compiled.remove(item)
+                            fallback.append(item[0])
+                    first_chunk = False
+                for (_, _, hist), expressions, selection in compiled:
+                    if selection is not None:
+                        weights = selection.weights(chunk)
+                        keep = weights != 0
+                        if not keep.any():
+                            continue
+                        weights = weights[keep]
+                    else:
+                        keep = slice(None)
+                        weights = np.ones(len(chunk))
+                    values = [expr(chunk)[keep] for expr in expressions]
+                    if len(values) == 1:
+                        values = values[0]
+                    else:
+                        values = np.column_stack(values)
+                    hist.fill_array(values, weights * tree_weight)
+
+        for expression, selection, hist in fallback:
+            self.Draw(expression, selection, hist=hist)
+
     def to_array(self, *args, **kwargs):
         """
         Convert this tree into a NumPy structured array
@@ -750,6 +965,54 @@ class BaseTree(NamedObject): # Plottable
         from root_numpy import tree2array
         return tree2array(self, *args, **kwargs)
 
+    def iterate_chunks(self, branches=None, chunk_size=100000,
+                       selection=None):
+        """
+        Iterate over blocks of entries as NumPy structured arrays. Unlike
+        ``__iter__`` the TreeBuffer is not refilled for each entry, so cuts
+        may be applied on whole columns at once with NumPy.
+
+        Parameters
+        ----------
+        branches : str or list, optional (default=None)
+            Only read these branches. Globbing with '*' is supported. If None
+            then all branches of supported types are read.
+
+        chunk_size : int, optional (default=100000)
+            The number of entries in each block.
+
+        selection : str or rootpy.tree.Cut, optional (default=None)
+            Only include entries passing this selection. Blocks may then
+            contain fewer than ``chunk_size`` entries.
+
+        Returns
+        -------
+        generator of NumPy structured arrays
+        """
+        from root_numpy import tree2array
+        if chunk_size < 1:
+            raise ValueError("chunk_size must be at least 1")
+        if branches is not None:
+            if isinstance(branches, basestring):
+                branches = [branches]
+            expanded = []
+            for branch in branches:
+                if '*' in branch:
+                    expanded += self.glob(branch)
+                else:
+                    expanded.append(branch)
+            branches = expanded
+        if selection is not None:
+            selection = str(Cut(selection)) or None
+        # only the range of entries set with set_entry_range is read
+        start, stop = self._entry_bounds()
+        for offset in xrange(start, stop, chunk_size):
+            yield tree2array(self,
+                             branches=branches,
+                             selection=selection,
+                             entries=min(chunk_size, stop - offset),
+                             offset=offset)
+
 
 @snake_case_methods
 class Tree(BaseTree, QROOT.TTree):
@@ -36,6 +36,7 @@ class TreeBuffer(OrderedDict):
         self._collections = {}
         self._objects = []
         self._entry = Int(0)
+        self._usage = None
         if branches is not None:
             self.__process(branches)
         self._inited = True
@@ -133,6 +134,10 @@ class TreeBuffer(OrderedDict):
 
     def get_with_read_if_cached(self, attr):
 
+        if (self._usage is not None and
+                attr not in self._usage.branches and attr in self):
+            # record the branches accessed by the analysis
+            self._usage.add(attr)
         if self._tree is not None:
             if attr not in self._branch_cache:
                 # attr branch is being accessed for the first time in this
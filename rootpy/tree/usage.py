@@ -0,0 +1,115 @@
+# Copyright 2012 the rootpy developers
+# distributed under the terms of the GNU General Public License
+"""
+This module records which branches an analysis accesses through the
+TreeBuffer and stores them in a file so that later runs of the same analysis
+only activate and cache those branches::
+
+    chain = TreeChain('tree', files, branch_usage='my_analysis',
+                      read_branches_on_demand=True, cache=True)
+
+The first run records the branches. The following runs activate only the
+recorded branches (plus ``always_read``), add them to the TTreeCache and
+stop its learning phase. A branch accessed for the first time in a later
+run is activated immediately and added to the record.
+"""
+import os
+import json
+import tempfile
+
+from .. import log; log = log[__name__]
+
+__all__ = [
+    'BranchUsage',
+]
+
+
+class BranchUsage(object):
+    """
+    The set of branches accessed by an analysis
+
+    Parameters
+    ----------
+    name : str
+        The name of the analysis. The branches are stored in
+        ``branch_usage/<name>.json`` in the rootpy user data directory
+        unless ``filename`` is given.
+
+    filename : str, optional (default=None)
+        The file the branches are stored in
+    """
+    def __init__(self, name, filename=None):
+
+        if filename is None:
+            from .. import userdata
+            directory = os.path.join(userdata.DATA_ROOT, 'branch_usage')
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+            filename = os.path.join(directory, '%s.json' % name)
+        self.name = name
+        self.filename = filename
+        self.branches = set()
+        self.tree = None
+        self._modified = False
+        if os.path.exists(filename):
+            with open(filename) as f:
+                self.branches = set(json.load(f)['branches'])
+            log.info("%s uses %i recorded branches" %
+                (name, len(self.branches)))
+        # only prune branches if they were recorded by a previous run
+        self.prune = bool(self.branches)
+
+    def attach(self, tree, always_read=None):
+        """
+        Record the branches accessed in a tree. If branches were recorded
+        by a previous run, only activate them (and ``always_read``) and add
+        them to the TTreeCache of the tree if it has one.
+        """
+        self.tree = tree
+        tree._buffer._usage = self
+        if not self.prune:
+            return
+        branches = list(self.branches)
+        if always_read:
+            branches += always_read
+        tree.activate(branches, exclusive=True)
+        if tree.GetCacheSize() > 0:
+            for branch in branches:
+                if tree.has_branch(branch):
+                    tree.AddBranchToCache(branch, True)
+            tree.StopCacheLearningPhase()
+
+    def add(self, branch):
+        """
+        Record a branch accessed for the first time. If branches are being
+        pruned the branch is activated and read for the current entry.
+        """
+        self.branches.add(branch)
+        self._modified = True
+        tree = self.tree
+        if not self.prune or tree is None:
+            return
+        tbranch = tree.GetBranch(branch)
+        if not tbranch:
+            return
+        log.warning("branch %s was not recorded by previous runs of %s "
+                    "(activating it)" % (branch, self.name))
+        tree.SetBranchStatus(branch, 1)
+        if tree.GetCacheSize() > 0:
+            tree.AddBranchToCache(branch, True)
+        entry = tree.GetReadEntry()
+        if entry >= 0:
+            tbranch.GetEntry(entry)
+
+    def save(self):
+        """
+        Write the recorded branches if new branches were accessed
+        """
+        if not self._modified:
+            return
+        fd, tmp = tempfile.mkstemp(
+            dir=os.path.dirname(os.path.abspath(self.filename)))
+        with os.fdopen(fd, 'w') as f:
+            json.dump({'branches': sorted(self.branches)}, f, indent=2)
+        os.rename(tmp, self.filename)
+        self._modified = False